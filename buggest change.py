@@ -5,6 +5,8 @@ import shutil
 import sys
 import os
 import pandas as pd
+from parallel_csv import read_frame_parallel
+from recon_keys import composite_key_hashes
 import comp2
 
 
@@ -28,100 +30,70 @@ def read_mapping(file):
     return mapping
 
 
-def update_column_names(file, column_mapping):
-    with open(file, "r") as f:
-        reader = csv.DictReader(f, delimiter=delimiter)
-        rows = list(reader)
-        new_fieldnames = [column_mapping.get(name, name) for name in reader.fieldnames]
-
-    with open(file, "w", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=new_fieldnames, delimiter=delimiter)
-        writer.writeheader()
-        for row in rows:
-            new_row = {
-                column_mapping.get(name, name): value for name, value in row.items()
-            }
-            writer.writerow(new_row)
-
-
-def create_temp_files(file1, file2, column_mapping=None, buffer_size=1024 * 1024):
-    global delimiter
-    delimiter = fetch_delimiter(file1)
-    print(delimiter)
-    # Copy file1
-    with open(file1, "rb") as fsrc, open("a_tmp.csv", "wb") as fdst:
-        shutil.copyfileobj(fsrc, fdst, buffer_size)
-
-    # Copy file2
-    with open(file2, "rb") as fsrc, open("b_tmp.csv", "wb") as fdst:
-        shutil.copyfileobj(fsrc, fdst, buffer_size)
-
-    if column_mapping is not None:
-        column_mapping = read_mapping("mapping.txt")
-        print(column_mapping)
-        update_column_names("a_tmp.csv", column_mapping)
-        update_column_names("b_tmp.csv", column_mapping)
+def read_frame(file_path, column_mapping=None, parse_workers=None):
+    """Read a delimited file as strings, renaming columns from mapping.txt if asked."""
+    return read_frame_parallel(
+        file_path,
+        fetch_delimiter(file_path),
+        read_mapping("mapping.txt") if column_mapping is not None else None,
+        workers=parse_workers,
+    )
 
 
-def perform_recon_on_files(file1, file2, col_check=None, column_mapping=None):
-    print(col_check)
+def perform_recon_on_frames(df1, df2, file1, file2, col_check=None, column_mapping=None):
+    """(kept df1, kept df2, extras in df1, extras in df2); the extras go to output1.csv and output2.csv."""
     delimiter1 = ","
-    delimiter2 = "|"
-    if col_check is not None:
-        # Read the CSV files
-        df1 = pd.read_csv(file1, dtype=str)
-        df2 = pd.read_csv(file2, dtype=str)
-
+    if col_check is None:
+        # Nothing to reconcile on, so every record is kept
+        in_file2 = pd.Series(True, index=df1.index)
+        in_file1 = pd.Series(True, index=df2.index)
+    else:
         col_check_list = col_check.split(",")
 
         if column_mapping is not None:
             col_check_list = [column_mapping.get(col, col) for col in col_check_list]
 
-        # Create sets for faster lookup
-        set1 = set(tuple(row) for row in df1[col_check_list].values)
-        set2 = set(tuple(row) for row in df2[col_check_list].values)
-
-        # Find extra records
-        extra_records1 = df1[~df1[col_check_list].apply(tuple, axis=1).isin(set2)]
-        extra_records2 = df2[~df2[col_check_list].apply(tuple, axis=1).isin(set1)]
-
-        # Write the results to output.csv
-        with open("output1.csv", "w", newline="") as output_file:
-            writer = csv.writer(
-                output_file, delimiter=delimiter1
-            )  # Use ',' as delimiter
-
-            # Write the first set of extra records
-            # writer.writerow([f"Extra records in {file1} which are not present in {file2} based on " + col_check + ": " + str(len(extra_records1))])
-            # writer.writerow([])
-            if not extra_records1.empty:
-                writer.writerow(extra_records1.columns)
-                extra_records1 = extra_records1.fillna("")
-                writer.writerows(extra_records1.values)
-            else:
-                writer.writerow([])
-
+        # Hash the key columns once; the extra and kept masks all come from it
+        key_hashes1, key_hashes2 = composite_key_hashes(df1, df2, col_check_list)
+        in_file2 = key_hashes1.isin(key_hashes2)
+        in_file1 = key_hashes2.isin(key_hashes1)
+
+    # Find extra records
+    extra_records1 = df1[~in_file2]
+    extra_records2 = df2[~in_file1]
+
+    # Write the results to output.csv
+    with open("output1.csv", "w", newline="") as output_file:
+        writer = csv.writer(
+            output_file, delimiter=delimiter1
+        )  # Use ',' as delimiter
+
+        # Write the first set of extra records
+        # writer.writerow([f"Extra records in {file1} which are not present in {file2} based on " + col_check + ": " + str(len(extra_records1))])
+        # writer.writerow([])
+        if not extra_records1.empty:
+            writer.writerow(extra_records1.columns)
+            extra_records1 = extra_records1.fillna("")
+            writer.writerows(extra_records1.values)
+        else:
             writer.writerow([])
 
-        with open("output2.csv", "w", newline="") as output_file:
-            writer = csv.writer(output_file, delimiter=delimiter1)
+        writer.writerow([])
 
-            # Write the second set of extra records
-            # writer.writerow([f"Extra records in {file2} which are not present in {file1} based on " + col_check + ": " + str(len(extra_records2))])
-            # writer.writerow([])
-            if not extra_records2.empty:
-                writer.writerow(extra_records2.columns)
-                extra_records2 = extra_records2.fillna("")
-                writer.writerows(extra_records2.values)
-            else:
-                writer.writerow([])
+    with open("output2.csv", "w", newline="") as output_file:
+        writer = csv.writer(output_file, delimiter=delimiter1)
 
-        # Update the temporary files
-        df1 = df1[df1[col_check_list].apply(tuple, axis=1).isin(set2)]
-        df2 = df2[df2[col_check_list].apply(tuple, axis=1).isin(set1)]
-        df1.to_csv(file1, index=False, sep=delimiter1)
-        df2.to_csv(file2, index=False, sep=delimiter2)
-        return len(extra_records1), len(extra_records2)
+        # Write the second set of extra records
+        # writer.writerow([f"Extra records in {file2} which are not present in {file1} based on " + col_check + ": " + str(len(extra_records2))])
+        # writer.writerow([])
+        if not extra_records2.empty:
+            writer.writerow(extra_records2.columns)
+            extra_records2 = extra_records2.fillna("")
+            writer.writerows(extra_records2.values)
+        else:
+            writer.writerow([])
+
+    return df1[in_file2], df2[in_file1], len(extra_records1), len(extra_records2)
 
 
 # Run the compare_csv function with the required parameters
@@ -129,6 +101,8 @@ file1 = "a.dat"
 file2 = "b.dat"
 column_mapping = None
 col_check = None
+keep_temp_files = False
+parse_workers = None
 
 for arg in sys.argv:
     if arg.startswith("col_check="):
@@ -157,20 +131,48 @@ for arg in sys.argv:
                             column_mapping[src_col] = dest_col
         else:
             column_mapping = None
+    elif arg.startswith("keep_temp_files="):
+        _, value = arg.split("=")
+        keep_temp_files = value.lower() == "y"
+    elif arg.startswith("parse_workers="):
+        _, value = arg.split("=")
+        parse_workers = int(value)
 
 
-def recon(file1, file2, col_check=col_check, column_mapping=column_mapping):
-    create_temp_files(file1, file2, column_mapping)
-    rec1, rec2 = perform_recon_on_files(
-        "a_tmp.csv", "b_tmp.csv", col_check=col_check, column_mapping=column_mapping
+def recon(
+    file1,
+    file2,
+    col_check=col_check,
+    column_mapping=column_mapping,
+    keep_temp_files=False,
+    parse_workers=None,
+):
+    # Parse each file once; the kept frames go straight to the comparison
+    df1 = read_frame(file1, column_mapping, parse_workers)
+    df2 = read_frame(file2, column_mapping, parse_workers)
+    df1, df2, rec1, rec2 = perform_recon_on_frames(
+        df1, df2, file1, file2, col_check=col_check, column_mapping=column_mapping
     )
     print(rec1)
+
+    if keep_temp_files:
+        # Debug copies of exactly what the comparison is given
+        df1.to_csv("a_tmp.csv", index=False)
+        df2.to_csv("b_tmp.csv", index=False)
+
     comp2.compare_csv_files(
-        "a_tmp.csv", "b_tmp.csv", "output.html", rec1, rec2, col_check=col_check
+        file1, file2, "output.html", rec1, rec2, col_check=col_check, frames=(df1, df2)
     )
 
 
-recon(file1, file2, col_check=col_check, column_mapping=column_mapping)
+recon(
+    file1,
+    file2,
+    col_check=col_check,
+    column_mapping=column_mapping,
+    keep_temp_files=keep_temp_files,
+    parse_workers=parse_workers,
+)
 
 comp2.py
 
@@ -183,6 +185,8 @@ import concurrent.futures
 import pandas as pd
 import itertools
 import base64
+import numpy as np
+from fingerprints import fingerprint_values
 
 
 def read_file(file_path, column_mapping=None):
@@ -221,6 +225,18 @@ def mixed_type_sort_key(row, keys=None):
     return tuple(sort_key)
 
 
+def row_fingerprint(row, header):
+    """128-bit blake2b digest over the type-tagged encoding of a row's columns."""
+    return fingerprint_values([row[col] for col in header])
+
+
+def frame_rows(df, chunk_size=10000):
+    """Yield the rows of a DataFrame as dicts, one chunk at a time."""
+    for start in range(0, len(df), chunk_size):
+        for row in df.iloc[start : start + chunk_size].to_dict("records"):
+            yield row
+
+
 def compare_csv_files(
     file1,
     file2,
@@ -231,6 +247,7 @@ def compare_csv_files(
     exclude_keys=None,
     column_mapping=None,
     col_check=None,
+    frames=None,
 ):
     print(column_mapping)
     usr_exclusion_msg = (
@@ -245,10 +262,15 @@ def compare_csv_files(
     num_records_file1_not_in_file2 = 0
     num_records_file2_not_in_file1 = 0
 
-    # Open the input files and output file for writing HTML table
-    with open(file1, "r") as f1, open(file2, "r") as f2, open(outfile, "w") as outfile:
-        rows1 = read_file(file1, column_mapping)
-        rows2 = read_file(file2, column_mapping)
+    # Open the output file for writing HTML table
+    with open(outfile, "w") as outfile:
+        if frames is not None:
+            # Frames handed over by recon are compared without re-reading the files
+            rows1 = frame_rows(frames[0])
+            rows2 = frame_rows(frames[1])
+        else:
+            rows1 = read_file(file1, column_mapping)
+            rows2 = read_file(file2, column_mapping)
 
         try:
             first_row1 = next(rows1)
@@ -402,21 +424,22 @@ def compare_csv_files(
         )
         html += '<table style="border: 1px solid black; border-collapse: collapse;">\n'
 
-        # Compare each row from both files
-
-        sorted_rows1_set = set(
-            tuple(sorted(sorted_row.items())) for sorted_row in sorted_rows1
+        # Compare each row from both files on compact row fingerprints
+        fingerprints1 = np.array(
+            [row_fingerprint(row, header1) for row in sorted_rows1], dtype="S16"
         )
-        sorted_rows2_set = set(
-            tuple(sorted(sorted_row.items())) for sorted_row in sorted_rows2
+        fingerprints2 = np.array(
+            [row_fingerprint(row, header1) for row in sorted_rows2], dtype="S16"
         )
-        num_diff_records = len(sorted_rows1_set.symmetric_difference(sorted_rows2_set))
+        distinct1 = np.unique(fingerprints1)
+        distinct2 = np.unique(fingerprints2)
         num_records_file1_not_in_file2 = len(
-            sorted_rows1_set.difference(sorted_rows2_set)
+            np.setdiff1d(distinct1, distinct2, assume_unique=True)
         )
         num_records_file2_not_in_file1 = len(
-            sorted_rows2_set.difference(sorted_rows1_set)
+            np.setdiff1d(distinct2, distinct1, assume_unique=True)
         )
+        num_diff_records = num_records_file1_not_in_file2 + num_records_file2_not_in_file1
 
         # col = "/v/g/"
 
@@ -450,9 +473,13 @@ def compare_csv_files(
             diff_columns = set()
 
             # Compare each row from both files and add different rows to diff_rows list
-            for row_num, (row1, row2) in enumerate(
-                zip(sorted_rows1, sorted_rows2), start=1
+            for row_num, (row1, row2, fingerprint1, fingerprint2) in enumerate(
+                zip(sorted_rows1, sorted_rows2, fingerprints1, fingerprints2), start=1
             ):
+                # Matching fingerprints mean identical rows
+                if fingerprint1 == fingerprint2:
+                    continue
+
                 row_diff = False
                 diff_cols = []
 
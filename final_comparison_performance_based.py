@@ -5,13 +5,35 @@ import sys
 from operator import itemgetter
 import concurrent.futures
 import pandas as pd
+import numpy as np
 import itertools
 import base64
+import multiprocessing
 from multiprocessing import Pool
 from functools import partial
 import subprocess
 import heapq
+import bisect
+import random
+import pickle
+import struct
+import datetime
+import tempfile
+import zlib
+import gzip
+import json
+import hashlib
+import io
+import mmap
 from concurrent.futures import ThreadPoolExecutor
+from fingerprints import fingerprint_values
+from parallel_csv import next_record_end, read_file_parallel
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Only needed for the diff_output= artifact
+    pa = pq = None
 
 
 '''
@@ -72,51 +94,1060 @@ def chunks(iterable, chunk_size):
             return
         yield chunk
 
-def parallel_sort_rows(rows, sort_keys=None):
+def parallel_sort_rows(rows, sort_keys=None, key_types=None):
     # Number of parallel threads (adjust according to your system)
     num_threads = 4
 
+    # Sort on keys encoded once per row instead of rebuilding them on every comparison;
+    # the (key, row) pairs are returned so the key join can reuse the keys
     with ThreadPoolExecutor(max_workers=num_threads) as executor:
         sorted_rows = []
-        for chunk in chunks(rows, chunk_size=10000):
-            future = executor.submit(sorted, chunk, key=lambda row: mixed_type_sort_key(row, sort_keys))
+        for chunk in chunks(keyed_rows(rows, sort_keys, key_types), chunk_size=10000):
+            future = executor.submit(sorted, chunk, key=itemgetter(0))
             sorted_rows.append(future.result())
 
-    return list(heapq.merge(*sorted_rows, key=lambda row: mixed_type_sort_key(row, sort_keys)))
+    return list(heapq.merge(*sorted_rows, key=itemgetter(0)))
 
-def process_batches(sorted_rows, sort_keys, batch_size):
+def process_batches(sorted_rows, sort_keys, batch_size, key_types=None):
     result_batches = []
     with ThreadPoolExecutor() as executor:
-        for batch in chunks(sorted_rows, 5000):
-            future = executor.submit(parallel_sort_rows, batch, sort_keys)
+        for batch in chunks(keyed_rows(sorted_rows, sort_keys, key_types), 5000):
+            future = executor.submit(sorted, batch, key=itemgetter(0))
             result_batches.append(future)
     
-    sorted_rows = list(heapq.merge(*[f.result() for f in result_batches], key=lambda row: mixed_type_sort_key(row, sort_keys)))
+    sorted_rows = [row for _, row in heapq.merge(*[f.result() for f in result_batches], key=itemgetter(0))]
     return sorted_rows
-   # ................................................................................................... 
-def parallel_compare_rows(row1, row2):
-    # Compare each row from both files and return the differences
-    row_diff = False
-    diff_cols = []
 
-    for col, val1 in row1.items():
-        val2 = row2[col]
+#                                                                     Encoded sort keys
+
+def encode_typed_value(value, key_type):
+    """Fixed-width big-endian bytes for a numeric or date value."""
+    if key_type == "int":
+        return struct.pack(">Q", int(value) + 2**63)
+    if key_type == "float":
+        bits = struct.unpack(">Q", struct.pack(">d", float(value)))[0]
+        # Flip negatives entirely and set the sign bit on positives so bytes order like floats
+        bits = bits ^ 0xFFFFFFFFFFFFFFFF if bits >> 63 else bits | 1 << 63
+        return struct.pack(">Q", bits)
+    if key_type == "date":
+        if not isinstance(value, datetime.date):
+            value = datetime.date.fromisoformat(value)
+        return struct.pack(">I", value.toordinal())
+    raise ValueError(f"Unsupported key type: {key_type}")
+
+
+def encode_sort_value(value, key_type=None):
+    """Order-preserving, prefix-free bytes for one sort key value: nulls, then typed values, then strings."""
+    if not isinstance(value, str) and pd.isnull(value):
+        return b"\x00"
+    if key_type is not None or not isinstance(value, str):
+        try:
+            return b"\x01" + encode_typed_value(value, key_type or "float")
+        except (TypeError, ValueError, OverflowError, struct.error):
+            pass
+    # Escape NUL and terminate so that shorter strings sort before their extensions
+    return b"\x02" + str(value).encode("utf-8").replace(b"\x00", b"\x00\xff") + b"\x00\x00"
+
+
+def encode_sort_key(row, keys=None, key_types=None):
+    """Encode the sort key of a row into bytes that compare like mixed_type_sort_key."""
+    # key_types maps columns to "int", "float" or "date" to sort them by value rather than as text
+    if keys is None:
+        keys = row.keys()  # Use all keys if none are specified
+    key_types = key_types or {}
+    return b"".join(encode_sort_value(row[key], key_types.get(key)) for key in keys)
+
+
+def keyed_rows(rows, sort_keys=None, key_types=None):
+    """Yield (encoded sort key, row) pairs, computing each key exactly once."""
+    for row in rows:
+        yield encode_sort_key(row, sort_keys, key_types), row
+
+#                                                                     Row fingerprints
+
+def row_fingerprints(rows, header):
+    """Fingerprint each row over the header columns into a compact S16 array."""
+    return np.array(
+        [fingerprint_values([row[col] for col in header]) for row in rows], dtype="S16"
+    )
+
+
+def column_fingerprints(columns):
+    """Fingerprint each row of a set of column arrays into an S16 array."""
+    return np.array([fingerprint_values(values) for values in zip(*columns)], dtype="S16")
+
+
+def count_fingerprint_differences(fingerprints1, fingerprints2):
+    """Count distinct rows only in file1 and only in file2 from their fingerprints."""
+    distinct1 = np.unique(fingerprints1)
+    distinct2 = np.unique(fingerprints2)
+    return (
+        len(np.setdiff1d(distinct1, distinct2, assume_unique=True)),
+        len(np.setdiff1d(distinct2, distinct1, assume_unique=True)),
+    )
+
+#                                                                     Sample sort over processes
+
+# Rows being sample-sorted; forked sort workers inherit them instead of receiving a copy
+sample_sort_input = None
+
+
+def partition_slice(start, stop, sort_keys, splitters, key_types=None):
+    """Row indices of one slice of sample_sort_input, per partition (worker, phase 1)."""
+    partitions = [[] for _ in range(len(splitters) + 1)]
+    for row_index in range(start, stop):
+        key = encode_sort_key(sample_sort_input[row_index], sort_keys, key_types)
+        partitions[bisect.bisect_right(splitters, key)].append(row_index)
+    return partitions
+
+
+def sort_partition(row_indices, sort_keys, key_types=None):
+    """Sorted (sort key, row index) pairs of one whole partition of sample_sort_input (worker, phase 2)."""
+    partition = [
+        (encode_sort_key(sample_sort_input[row_index], sort_keys, key_types), row_index)
+        for row_index in row_indices
+    ]
+    # Indices arrive in input order and the sort is stable, so equal keys keep it as sorted() does
+    partition.sort(key=itemgetter(0))
+    return partition
+
+
+def sample_sort_rows(rows, sort_keys=None, workers=None, oversample=32, key_types=None, min_rows=200000):
+    """Sort rows as (encoded key, row) pairs over forked processes, range-partitioned on sampled keys."""
+    global sample_sort_input
+    rows = rows if isinstance(rows, list) else list(rows)
+    workers = workers or os.cpu_count()
+    if workers < 2 or len(rows) < min_rows or "fork" not in multiprocessing.get_all_start_methods():
+        # Below min_rows the pool costs more than it saves
+        return sorted(keyed_rows(rows, sort_keys, key_types), key=itemgetter(0))
+
+    # The parent encodes only the sample
+    sample = sorted(
+        encode_sort_key(rows[row_index], sort_keys, key_types)
+        for row_index in random.sample(range(len(rows)), min(workers * oversample, len(rows)))
+    )
+    splitters = [sample[i * len(sample) // workers] for i in range(1, workers)]
+    slice_size = -(-len(rows) // workers)
+    starts = range(0, len(rows), slice_size)
+    stops = [min(start + slice_size, len(rows)) for start in starts]
+
+    sample_sort_input = rows
+    try:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("fork")
+        ) as executor:
+            pieces = list(
+                executor.map(
+                    partition_slice,
+                    starts,
+                    stops,
+                    itertools.repeat(sort_keys),
+                    itertools.repeat(splitters),
+                    itertools.repeat(key_types),
+                )
+            )
+            partitions = [
+                list(itertools.chain.from_iterable(piece[partition_index] for piece in pieces))
+                for partition_index in range(len(splitters) + 1)
+            ]
+            sorted_partitions = list(
+                executor.map(
+                    sort_partition,
+                    partitions,
+                    itertools.repeat(sort_keys),
+                    itertools.repeat(key_types),
+                )
+            )
+    finally:
+        sample_sort_input = None
+
+    # Partitions cover ascending key ranges, so concatenating them is the whole merge
+    return [
+        (key, rows[row_index])
+        for partition in sorted_partitions
+        for key, row_index in partition
+    ]
+
+#                                                                     External merge sort
+
+def external_sort_key(row, header, sort_keys=None, key_types=None):
+    """(sort key, row fingerprint): sorts like the in-memory path, ties broken on the row itself."""
+    # Without sort_keys rows sort on the header order, as parallel_sort_rows does;
+    # equal keys mean identical rows, so the run-difference count can rely on them
+    return (
+        encode_sort_key(row, header if sort_keys is None else sort_keys, key_types),
+        fingerprint_values([row[col] for col in header]),
+    )
+
+
+def estimate_row_size(row):
+    return sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row.values())
+
+
+def write_sorted_run(keyed_rows, spill_dir):
+    keyed_rows.sort(key=itemgetter(0))
+    fd, run_path = tempfile.mkstemp(suffix=".run", dir=spill_dir)
+    with os.fdopen(fd, "wb") as f:
+        for batch in chunks(keyed_rows, 1000):
+            pickle.dump(batch, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return run_path
+
+
+def read_sorted_run(run_path):
+    with open(run_path, "rb") as f:
+        while True:
+            try:
+                batch = pickle.load(f)
+            except EOFError:
+                return
+            yield from batch
+
+
+def external_sort_rows(rows, sort_keys=None, memory_budget_mb=512, spill_dir=None, key_types=None, header=None):
+    """Sort rows into spill files of at most memory_budget_mb each; returns (run paths, number of rows)."""
+    memory_budget = memory_budget_mb * 1024 * 1024
+    run_paths = []
+    num_rows = 0
+    buffer = []
+    buffer_size = 0
+    for row in rows:
+        if header is None:
+            header = list(row)
+        key = external_sort_key(row, header, sort_keys, key_types)
+        buffer.append((key, row))
+        buffer_size += estimate_row_size(row) + sys.getsizeof(key)
+        num_rows += 1
+        if buffer_size >= memory_budget:
+            run_paths.append(write_sorted_run(buffer, spill_dir))
+            buffer = []
+            buffer_size = 0
+    if buffer:
+        run_paths.append(write_sorted_run(buffer, spill_dir))
+    # Both files' runs are merged side by side later, so keep each side's fan-in small
+    run_paths = reduce_sorted_runs(run_paths, spill_dir, remove_inputs=True)
+    return run_paths, num_rows
+
+
+# Most run files merged (and so held open) at once; 2 x 64 stays well under ulimit -n 1024
+MAX_MERGE_FAN_IN = 64
+
+
+def merge_run_group(run_paths, spill_dir=None):
+    """Merge sorted runs into one new run file, streaming a batch at a time."""
+    fd, run_path = tempfile.mkstemp(suffix=".run", dir=spill_dir)
+    with os.fdopen(fd, "wb") as f:
+        merged = heapq.merge(*[read_sorted_run(path) for path in run_paths], key=itemgetter(0))
+        for batch in chunks(merged, 1000):
+            pickle.dump(batch, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return run_path
+
+
+def reduce_sorted_runs(run_paths, spill_dir=None, max_fan_in=MAX_MERGE_FAN_IN, remove_inputs=False):
+    """Merge runs max_fan_in at a time, pass after pass, until at most max_fan_in are left."""
+    # Runs written by an earlier pass are always removed once merged, the inputs only on request
+    removable = set(run_paths) if remove_inputs else set()
+    while len(run_paths) > max_fan_in:
+        merged_paths = []
+        for group in chunks(run_paths, max_fan_in):
+            if len(group) == 1:
+                merged_paths.append(group[0])
+                continue
+            merged_path = merge_run_group(group, spill_dir)
+            for run_path in group:
+                if run_path in removable:
+                    os.remove(run_path)
+            removable.add(merged_path)
+            merged_paths.append(merged_path)
+        run_paths = merged_paths
+    return run_paths
+
+
+def merge_sorted_runs(run_paths, max_fan_in=MAX_MERGE_FAN_IN):
+    """Stream (key, row) pairs of all runs in key order, one batch per run in memory."""
+    if len(run_paths) > max_fan_in:
+        run_paths = reduce_sorted_runs(run_paths, os.path.dirname(run_paths[0]), max_fan_in)
+    return heapq.merge(
+        *[read_sorted_run(run_path) for run_path in run_paths], key=itemgetter(0)
+    )
+
+
+def count_sorted_run_differences(run_paths1, run_paths2):
+    """Count distinct rows only in file1 and only in file2 in one streaming pass."""
+    # Run keys end in the row fingerprint, so distinct keys are distinct rows
+    def distinct_keys(run_paths):
+        previous = None
+        for key, _ in merge_sorted_runs(run_paths):
+            if key != previous:
+                yield key
+            previous = key
+
+    keys1 = distinct_keys(run_paths1)
+    keys2 = distinct_keys(run_paths2)
+    key1 = next(keys1, None)
+    key2 = next(keys2, None)
+    only_in_file1 = 0
+    only_in_file2 = 0
+    while key1 is not None and key2 is not None:
+        if key1 == key2:
+            key1 = next(keys1, None)
+            key2 = next(keys2, None)
+        elif key1 < key2:
+            only_in_file1 += 1
+            key1 = next(keys1, None)
+        else:
+            only_in_file2 += 1
+            key2 = next(keys2, None)
+    only_in_file1 += sum(1 for _ in keys1) + (key1 is not None)
+    only_in_file2 += sum(1 for _ in keys2) + (key2 is not None)
+    return only_in_file1, only_in_file2
+#                                                                     Vectorized row comparison
+
+def compare_column_batch(columns1, columns2):
+    """Packed per-row mismatch bitmask and per-column mismatch counts of aligned column arrays."""
+    # Two nulls count as equal
+    num_rows = len(columns1[0]) if columns1 else 0
+    mismatches = np.zeros((num_rows, len(columns1)), dtype=bool)
+    for i, (col1, col2) in enumerate(zip(columns1, columns2)):
+        mismatches[:, i] = (col1 != col2) & ~(pd.isnull(col1) & pd.isnull(col2))
+    return np.packbits(mismatches, axis=1), mismatches.sum(axis=0)
+
+
+def mismatch_columns(header, bitmask_row):
+    """Column names flagged in one row of a packed mismatch bitmask."""
+    return [header[i] for i in np.flatnonzero(np.unpackbits(bitmask_row, count=len(header)))]
+
+
+def rows_to_columns(header, rows):
+    """Transpose a batch of row dicts into one object array per column."""
+    columns = []
+    for col in header:
+        column = np.empty(len(rows), dtype=object)
+        column[:] = [row[col] for row in rows]
+        columns.append(column)
+    return columns
+
+
+def count_items(iterable, counter):
+    """Pass the items of iterable through, counting them in counter[0]."""
+    for item in iterable:
+        counter[0] += 1
+        yield item
+
+
+def compare_row_pairs(row_pairs, batch_size=10000):
+    """Yield (pairs compared, diff rows, per-column mismatch counts) per batch of (row number, row1, row2)."""
+    # A row missing on one side is None and is reported with all of its columns
+    row_pairs = iter(row_pairs)
+    while True:
+        batch = list(itertools.islice(row_pairs, batch_size))
+        if not batch:
+            return
+
+        paired = [
+            batch_index for batch_index, (_, row1, row2) in enumerate(batch)
+            if row1 is not None and row2 is not None
+        ]
+        column_counts = {}
+        changed = {}
+        if paired:
+            header = list(batch[paired[0]][1])
+            bitmask, counts = compare_column_batch(
+                rows_to_columns(header, [batch[batch_index][1] for batch_index in paired]),
+                rows_to_columns(header, [batch[batch_index][2] for batch_index in paired]),
+            )
+            column_counts = {col: int(count) for col, count in zip(header, counts) if count}
+            for pair_index in np.flatnonzero(bitmask.any(axis=1)):
+                changed[paired[pair_index]] = mismatch_columns(header, bitmask[pair_index])
+
+        diff_rows = []
+        for batch_index, (row_num, row1, row2) in enumerate(batch):
+            if row2 is None:
+                diff_rows.append((row_num, list(row1), row1, None))
+            elif row1 is None:
+                diff_rows.append((row_num, list(row2), None, row2))
+            elif batch_index in changed:
+                diff_rows.append((row_num, changed[batch_index], row1, row2))
+        yield len(batch), diff_rows, column_counts
+
+#                                                                     Key-based matching
+
+def pair_key_group(group1, group2):
+    """Yield ((row number 1, row number 2), row1, row2) pairs for the (row number, row) groups of one key."""
+    # Identical rows cancel out first; the rest pair in row order, None marking a missing partner
+    if len(group1) == 1 and len(group2) == 1:
+        (row_num1, row1), (row_num2, row2) = group1[0], group2[0]
+        yield (row_num1, row_num2), row1, row2
+        return
+
+    remaining2 = {}
+    for row_num, row in group2:
+        remaining2.setdefault(fingerprint_values([row[col] for col in sorted(row)]), []).append(
+            (row_num, row)
+        )
+    unmatched1 = []
+    for row_num, row in group1:
+        identical_rows = remaining2.get(fingerprint_values([row[col] for col in sorted(row)]))
+        if identical_rows:
+            identical_rows.pop(0)
+        else:
+            unmatched1.append((row_num, row))
+    unmatched2 = sorted(
+        (entry for entries in remaining2.values() for entry in entries), key=itemgetter(0)
+    )
+
+    for entry1, entry2 in itertools.zip_longest(unmatched1, unmatched2):
+        if entry2 is None:
+            yield (entry1[0], None), entry1[1], None
+        elif entry1 is None:
+            yield (None, entry2[0]), None, entry2[1]
+        else:
+            yield (entry1[0], entry2[0]), entry1[1], entry2[1]
+
+
+def merge_join_rows(keyed_rows1, keyed_rows2):
+    """Join two key-sorted (key, row) streams into pair_key_group row pairs, one key group at a time."""
+    def key_groups(keyed_rows):
+        numbered = (
+            (key, row_num, row) for row_num, (key, row) in enumerate(keyed_rows, start=1)
+        )
+        for key, group in itertools.groupby(numbered, key=itemgetter(0)):
+            yield key, [(row_num, row) for _, row_num, row in group]
+
+    groups1 = key_groups(keyed_rows1)
+    groups2 = key_groups(keyed_rows2)
+    group1 = next(groups1, None)
+    group2 = next(groups2, None)
+    while group1 is not None or group2 is not None:
+        if group2 is None or (group1 is not None and group1[0] < group2[0]):
+            yield from pair_key_group(group1[1], [])
+            group1 = next(groups1, None)
+        elif group1 is None or group2[0] < group1[0]:
+            yield from pair_key_group([], group2[1])
+            group2 = next(groups2, None)
+        else:
+            yield from pair_key_group(group1[1], group2[1])
+            group1 = next(groups1, None)
+            group2 = next(groups2, None)
+
+#                                                                     Report sections
+
+# One stylesheet for the differences table instead of a style attribute per cell
+REPORT_CSS = (
+    "body {font-family: Helvetica;}\n"
+    "table.d {font-family: Helvetica, sans-serif; font-size: 14px; border-collapse: collapse; width: 100%; border: 1px solid black; border-spacing: 0px;}\n"
+    "table.d th, table.d td {border: 1px solid black;}\n"
+    "table.d tr.h {background-color: #a0d1dd;}\n"
+    "table.d td.x {background-color: #ffcfbf; font-weight: bold;}\n"
+    "table.d td.n {font-style: italic;}\n"
+)
+
+
+def report_header_html():
+    """HTML head, recon status from output.csv and the summary table opening."""
+    html = f"<html>\n<head>\n<style>\n{REPORT_CSS}</style>\n</head>\n<body>\n"
 
-        if pd.isnull(val1) and pd.isnull(val2):
-            val1 = "NULL"
-            val2 = "NULL"
+    # Read the contents of output.csv
+    with open("output.csv", "r") as file:
+        csv_content = [line.strip() for line in file if line.strip()]
+
+    # Check if both lines contain ": 0"
+    recon_status = all(": 0" in line for line in csv_content)
+
+    # Encode the contents as Base64
+    csv_base64 = base64.b64encode("".join(csv_content).encode()).decode("utf-8")
+
+    # Embed the CSV as a data URI
+    html += '<div style="font-family: Helvetica, sans-serif; margin-top: 20px;">\n'
+    html += '<table style="border-collapse: collapse;">'
+
+    # Add the recon status to the HTML
+    if recon_status:
+        html += '<th colspan="100" style="color: green; font-weight: bold;">Recon Status: OK</th></tr>'
+    else:
+        html += '<th colspan="100" style="color: red; font-weight: bold;">Recon Status: NOK</th></tr>'
+
+    html += "<tr><td></td></tr>\n"
+    html += (
+        '<tr><td><a href="data:text/csv;base64,'
+        + csv_base64
+        + '" download="output.csv">Recon summary</a></td></tr>\n'
+    )
+    html += '<tr style="height: 20px;"><td></td></tr>\n'  # Add spacing of 20 pixels
+    html += "</table>\n"
+    html += "</div>\n"
+    html += (
+        '<tr><th style="border: 1px solid black;">Comparison Summary:-</th></tr>'
+    )
+    html += '<table style="border: 1px solid black; border-collapse: collapse;">\n'
+    return html
+
+
+def comparison_summary_html(
+    file1,
+    file2,
+    num_records,
+    num_diff_records,
+    num_records_file1_not_in_file2,
+    num_records_file2_not_in_file1,
+    combined_html_msg,
+):
+    """Comparison summary block with the record counts and exclusion notes."""
+    summary_html = '<div style="font-size: 15px;">'
+    summary_html += f"<p>Total Records in each file: {num_records}</p>"
+    summary_html += (
+        f"<p>Number of Rows with Differences: {int(num_diff_records)}</p>"
+    )
+    summary_html += f"<p>Number of records from {file1} differ from {file2}:  {num_records_file1_not_in_file2}</p>"
+    summary_html += f"<p>Number of records from {file2} differ from {file1}:  {num_records_file2_not_in_file1}</p>"
+    summary_html += f"<p>Please Note: {combined_html_msg}</p>"
+    summary_html += "</div>\n"
+    return summary_html
+
+
+def diff_table_header_html(header):
+    """Opening of the differences table with its column headings."""
+    html = '<table class="d">\n'
+    html += '<tr class="h"><th colspan="100">Differences</th></tr>'
+    html += '<tr class="h"><th>File</th><th>Row Number</th>'
+
+    # Write the headers of CSV files
+    for col in header:
+        html += f"<th>{col}</th>"
+
+    html += "</tr>\n"
+    return html
+
+
+def diff_row_html(diff_row, file1, file2, header, markup="css"):
+    """Table rows for one diff row, one per file."""
+    # markup="minimal" drops the optional end tags and attribute quotes, which browsers fill in
+    minimal = markup == "minimal"
+    cell_end = "" if minimal else "</td>"
+    row_end = "\n" if minimal else "</tr>\n"
+    changed_cell = "<td class=x>" if minimal else '<td class="x">'
+    missing_cell = (
+        f"<td colspan={len(header)} class=n>" if minimal else f'<td colspan="{len(header)}" class="n">'
+    )
+    diff_cols = set(diff_row[1])
+
+    fragments = []
+    for i, (file_name, row_data) in enumerate(((file1, diff_row[2]), (file2, diff_row[3]))):
+        # Key-matched rows carry their own row number in each file
+        row_num = diff_row[0][i] if isinstance(diff_row[0], tuple) else diff_row[0]
+
+        # Write the file name and row number
+        fragments.append(
+            f'<tr><td>{file_name}{cell_end}<td>{"" if row_num is None else row_num}{cell_end}'
+        )
+
+        if row_data is None:
+            fragments.append(f"{missing_cell}No matching record{cell_end}{row_end}")
+            continue
+
+        # Write the values of each column of the row
+        for col in header:
+            cell_value = row_data.get(col)
+            if pd.isnull(cell_value):
+                cell_value = "NULL"
+            fragments.append(
+                f"{changed_cell if col in diff_cols else '<td>'}{cell_value}{cell_end}"
+            )
+
+        fragments.append(row_end)
+    return "".join(fragments)
+
+
+def write_diff_rows(outfile, diff_rows, file1, file2, header, markup="css"):
+    """Write one batch of diff rows to the report with a single writelines call."""
+    outfile.writelines(
+        diff_row_html(diff_row, file1, file2, header, markup) for diff_row in diff_rows
+    )
+    outfile.flush()
+
+
+def diff_columns_html(diff_columns):
+    """List of the columns with differences, written once the table is complete."""
+    html = '<div style="font-family: Helvetica, sans-serif; margin-top: 20px;">\n'
+    html += '<table style="border-collapse: collapse;">'
+    html += '<tr style="background-color: #92b9bf; border: 1px solid black;"><th colspan="100" style="border: 1px solid black;">Columns with Differences:-</th></tr>'
+    for col in diff_columns:
+        html += f"<tr><td>{col}</td></tr>"
+    html += "</table>\n"
+    html += "</div>\n"
+    return html
+
+
+#                                                                     Paged report
+
+# Pages through the gzip JSONL shards next to the report; each line of a shard is
+# [row number in file1, row number in file2, changed columns, values1, values2]
+PAGED_REPORT_JS = """
+(function () {
+  var report = JSON.parse(document.getElementById("diff-shards").textContent);
+  var table = document.getElementById("diff-page");
+  var status = document.getElementById("diff-status");
+  var page = -1;
+
+  function cell(tr, text, cls, span) {
+    var td = tr.insertCell();
+    td.textContent = text === null ? "NULL" : text;
+    if (cls) td.className = cls;
+    if (span) td.colSpan = span;
+  }
+
+  function render(records) {
+    while (table.rows.length > 2) table.deleteRow(2);
+    records.forEach(function (r) {
+      [[report.file1, r[0], r[3]], [report.file2, r[1], r[4]]].forEach(function (side) {
+        var tr = table.insertRow();
+        cell(tr, side[0]);
+        cell(tr, side[1] === null ? "" : side[1]);
+        if (side[2] === null) { cell(tr, "No matching record", "n", report.header.length); return; }
+        side[2].forEach(function (value, i) {
+          cell(tr, value, r[2].indexOf(report.header[i]) >= 0 ? "x" : "");
+        });
+      });
+    });
+  }
+
+  function load(next) {
+    if (next < 0 || next >= report.shards.length) return;
+    status.textContent = "Loading page " + (next + 1) + "...";
+    fetch(report.dir + "/" + report.shards[next])
+      .then(function (resp) {
+        var text = resp.body.pipeThrough(new DecompressionStream("gzip"));
+        return new Response(text).text();
+      })
+      .then(function (text) {
+        page = next;
+        render(text.split("\\n").filter(Boolean).map(JSON.parse));
+        status.textContent = "Page " + (page + 1) + " of " + report.shards.length;
+      })
+      .catch(function (err) {
+        status.textContent = "Could not load " + report.shards[next] + " (" + err +
+          "). Browsers block fetch() on file:// pages; serve the report folder over HTTP, " +
+          "e.g. python -m http.server.";
+      });
+  }
+
+  document.getElementById("diff-prev").onclick = function () { load(page - 1); };
+  document.getElementById("diff-next").onclick = function () { load(page + 1); };
+})();
+"""
+
+
+def diff_row_record(diff_row, header):
+    """One diff row as a JSON-ready list for the paged report shards."""
+    row_nums = diff_row[0] if isinstance(diff_row[0], tuple) else (diff_row[0], diff_row[0])
+    values = []
+    for row_data in (diff_row[2], diff_row[3]):
+        if row_data is None:
+            values.append(None)
             continue
+        # Values are kept as the text the HTML table would show; NULLs as null
+        values.append(
+            [None if pd.isnull(row_data.get(col)) else str(row_data.get(col)) for col in header]
+        )
+    return [row_nums[0], row_nums[1], list(diff_row[1]), values[0], values[1]]
+
+
+def write_diff_shard(data_dir, shard_index, records):
+    """Write one gzip-compressed JSONL shard and return its file name."""
+    shard_name = f"diff-{shard_index:05d}.jsonl.gz"
+    with gzip.open(os.path.join(data_dir, shard_name), "wt", compresslevel=6) as shard:
+        shard.writelines(json.dumps(record, separators=(",", ":")) + "\n" for record in records)
+    return shard_name
+
+
+def paged_report_html(data_dir, shards, file1, file2, header, num_inline, num_diff_rows):
+    """Pager controls, an empty page table and the script that fills it from the shards."""
+    report = {
+        "dir": os.path.basename(data_dir),
+        "shards": shards,
+        "file1": file1,
+        "file2": file2,
+        "header": header,
+    }
+    html = (
+        f'<p>Showing the first {num_inline} of {num_diff_rows} differing rows inline. '
+        f'All rows are in {len(shards)} page(s) under {report["dir"]}/.</p>\n'
+    )
+    html += '<p><button id="diff-prev">Previous page</button> '
+    html += '<button id="diff-next">Next page</button> <span id="diff-status"></span></p>\n'
+    html += diff_table_header_html(header).replace('<table class="d">', '<table class="d" id="diff-page">', 1)
+    html += "</table>\n"
+    # "</" is escaped so a value cannot close the script element early
+    report_json = json.dumps(report).replace("</", "<\\/")
+    html += f'<script type="application/json" id="diff-shards">{report_json}</script>\n'
+    html += f"<script>{PAGED_REPORT_JS}</script>\n"
+    return html
+
+
+def diff_report_writer(outfile, report_path, file1, file2, header, markup="css", report="table", inline_rows=1000, shard_rows=5000):
+    """Return (write, finish) callables that take batches of diff rows for the report."""
+    # "table" renders every row; "paged" the first inline_rows, with all rows in
+    # gzip JSONL shards under <report name>_data; "none" leaves them out of the HTML
+    if report == "none":
+        return (lambda diff_rows: None), (lambda: None)
+
+    outfile.write(diff_table_header_html(header))
+    if report != "paged":
+        def write(diff_rows):
+            write_diff_rows(outfile, diff_rows, file1, file2, header, markup)
+
+        def finish():
+            outfile.write("</table>\n")
+
+        return write, finish
+
+    data_dir = os.path.splitext(report_path)[0] + "_data"
+    os.makedirs(data_dir, exist_ok=True)
+    shards = []
+    pending = []
+    written = {"inline": 0, "total": 0}
+
+    def write(diff_rows):
+        diff_rows = list(diff_rows)
+        if written["inline"] < inline_rows:
+            inline = diff_rows[: inline_rows - written["inline"]]
+            write_diff_rows(outfile, inline, file1, file2, header, markup)
+            written["inline"] += len(inline)
+        written["total"] += len(diff_rows)
+
+        pending.extend(diff_row_record(diff_row, header) for diff_row in diff_rows)
+        while len(pending) >= shard_rows:
+            shards.append(write_diff_shard(data_dir, len(shards), pending[:shard_rows]))
+            del pending[:shard_rows]
+
+    def finish():
+        if pending:
+            shards.append(write_diff_shard(data_dir, len(shards), pending))
+            del pending[:]
+        outfile.write("</table>\n")
+        outfile.write(
+            paged_report_html(
+                data_dir, shards, file1, file2, header, written["inline"], written["total"]
+            )
+        )
+
+    return write, finish
+
+
+def combine_writers(*writers):
+    """Fan batches of diff rows out to several (write, finish) pairs."""
+    def write(diff_rows):
+        diff_rows = list(diff_rows)
+        for write_rows, _ in writers:
+            write_rows(diff_rows)
+
+    def finish():
+        for _, finish_rows in writers:
+            finish_rows()
+
+    return write, finish
+
+#                                                                     Diff artifact
+
+def diff_artifact_schema(header, key_columns, file1, file2):
+    """Arrow schema of the diff artifact: row numbers, key columns, mismatch bitmask and both sides' values."""
+    # Row numbers are null on the side a row is missing from; the bitmask has
+    # compare_column_batch's bit order and the header order is in the metadata
+    fields = [pa.field("row_num1", pa.int64()), pa.field("row_num2", pa.int64())]
+    fields += [pa.field(f"key_{col}", pa.string()) for col in key_columns]
+    fields.append(pa.field("mismatch", pa.binary((len(header) + 7) // 8)))
+    fields += [pa.field(f"{col}_file1", pa.string()) for col in header]
+    fields += [pa.field(f"{col}_file2", pa.string()) for col in header]
+    metadata = {"header": json.dumps(header), "file1": file1, "file2": file2}
+    return pa.schema(fields, metadata=metadata)
+
+
+def diff_artifact_batch(diff_rows, header, key_columns, schema):
+    """Turn one batch of diff rows into an Arrow record batch."""
+    column_index = {col: i for i, col in enumerate(header)}
+    row_nums1, row_nums2 = [], []
+    mismatches = np.zeros((len(diff_rows), len(header)), dtype=bool)
+    key_values = [[] for _ in key_columns]
+    values1 = [[] for _ in header]
+    values2 = [[] for _ in header]
+
+    for row_index, (row_num, diff_cols, row1, row2) in enumerate(diff_rows):
+        row_num1, row_num2 = row_num if isinstance(row_num, tuple) else (row_num, row_num)
+        row_nums1.append(None if row1 is None else row_num1)
+        row_nums2.append(None if row2 is None else row_num2)
+        for col in diff_cols:
+            if col in column_index:
+                mismatches[row_index, column_index[col]] = True
+
+        key_row = row1 if row1 is not None else row2
+        for values, col in zip(key_values, key_columns):
+            value = key_row.get(col)
+            values.append(None if pd.isnull(value) else str(value))
+        for values, row_data in ((values1, row1), (values2, row2)):
+            for column_values, col in zip(values, header):
+                value = None if row_data is None else row_data.get(col)
+                column_values.append(None if pd.isnull(value) else str(value))
+
+    bitmask = np.packbits(mismatches, axis=1)
+    arrays = [pa.array(row_nums1, pa.int64()), pa.array(row_nums2, pa.int64())]
+    arrays += [pa.array(values, pa.string()) for values in key_values]
+    arrays.append(
+        pa.FixedSizeBinaryArray.from_buffers(
+            schema.field("mismatch").type, len(diff_rows), [None, pa.py_buffer(bitmask.tobytes())]
+        )
+    )
+    arrays += [pa.array(values, pa.string()) for values in values1 + values2]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def diff_artifact_writer(path, header, key_columns, file1, file2):
+    """Return (write, finish) callables that append diff rows to a Parquet or Arrow IPC file."""
+    if pa is None:
+        raise ImportError("diff_output= needs pyarrow; install it with pip install pyarrow")
+
+    key_columns = [col for col in key_columns or [] if col in header]
+    schema = diff_artifact_schema(header, key_columns, file1, file2)
+    if os.path.splitext(path)[1].lower() in (".arrow", ".feather", ".ipc"):
+        writer = pa.ipc.new_file(path, schema)
+    else:
+        writer = pq.ParquetWriter(path, schema)
+
+    def write(diff_rows):
+        if diff_rows:
+            writer.write_batch(diff_artifact_batch(diff_rows, header, key_columns, schema))
+
+    def finish():
+        writer.close()
+
+    return write, finish
+
+#                                                                     Whole-file fast path
+
+def file_byte_digest(file_path):
+    """blake2b digest of a file's bytes."""
+    byte_digest = hashlib.blake2b()
+    if os.path.getsize(file_path):
+        with open(file_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            byte_digest.update(mm)
+    return byte_digest.digest()
+
+
+def file_records(file_path, column_mapping=None, digest=True):
+    """(delimiter, header, order-insensitive record digest, number of records) of a .csv/.dat file."""
+    _, file_extension = os.path.splitext(file_path)
+    delimiter = "," if file_extension == ".csv" else fetch_delimiter(file_path)
+
+    header = None
+    record_digest = 0
+    num_records = 0
+    if os.path.getsize(file_path) == 0:
+        return delimiter, header, record_digest if digest else None, num_records
+
+    with open(file_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos = 0
+        while header is None and pos < len(mm):
+            end = next_record_end(mm, pos)
+            record = mm[pos:end].rstrip(b"\r\n")
+            pos = end
+            if record:
+                # Parse the header exactly as read_file does, quotes, spaces and all
+                header = list(
+                    pd.read_csv(io.BytesIO(record), dtype=str, delimiter=delimiter, nrows=0).columns
+                )
+                if column_mapping:
+                    header = [column_mapping.get(col, col) for col in header]
+
+        if mm.find(b'"', pos) == -1:
+            # Without quotes every line is a record
+            mm.seek(pos)
+            records = iter(mm.readline, b"")
+        elif digest:
+            # Differently quoted records can parse the same, so the digest is no use
+            return delimiter, header, None, None
+        else:
+            records = quoted_records(mm, pos)
+
+        for record in records:
+            record = record.rstrip(b"\r\n")
+            if not record:
+                continue  # pandas skips blank lines as well
+            if digest:
+                record_digest += int.from_bytes(
+                    hashlib.blake2b(record, digest_size=16).digest(), "big"
+                )
+            num_records += 1
+
+    return delimiter, header, record_digest % 2**128 if digest else None, num_records
+
+
+def quoted_records(mm, pos):
+    """Yield the records of mm from pos, ending at newlines outside quoted fields as the parsers do."""
+    while pos < len(mm):
+        end = next_record_end(mm, pos)
+        yield mm[pos:end]
+        pos = end
+
+
+def files_equivalent(file1, file2, column_mapping=None):
+    """(reason, number of records, header) when two text files are equivalent without parsing them, else None."""
+    text_extensions = (".csv", ".dat")
+    if (
+        os.path.splitext(file1)[1] not in text_extensions
+        or os.path.splitext(file2)[1] not in text_extensions
+    ):
+        return None
+
+    # The byte check is cheap, so the per-record walk only runs when it fails
+    if file_byte_digest(file1) == file_byte_digest(file2):
+        _, header, _, num_records = file_records(file1, column_mapping, digest=False)
+        return "byte-identical", num_records, header or []
+
+    delimiter1, header1, record_digest1, num_records1 = file_records(file1, column_mapping)
+    if record_digest1 is None:
+        return None
+    delimiter2, header2, record_digest2, num_records2 = file_records(file2, column_mapping)
+    if (
+        delimiter1 == delimiter2
+        and header1 == header2
+        and record_digest1 == record_digest2
+        and num_records1 == num_records2
+    ):
+        return "identical apart from row order", num_records1, header1 or []
+    return None
+
+#                                                                     Hash-partitioned engine
+
+def partition_rows(rows, sort_keys, num_buckets, bucket_dir, prefix, key_types=None, memory_budget_mb=512, flush_mb=1):
+    """Hash-partition rows into num_buckets spill files of (key, row number, row); returns (paths, number of rows)."""
+    bucket_paths = [
+        os.path.join(bucket_dir, f"{prefix}_{bucket:05d}.pkl") for bucket in range(num_buckets)
+    ]
+    buffers = [[] for _ in range(num_buckets)]
+    buffer_sizes = [0] * num_buckets
+    buffered = [0]
+    flush_size = flush_mb * 1024 * 1024
+    memory_budget = memory_budget_mb * 1024 * 1024
+
+    def flush(bucket):
+        with open(bucket_paths[bucket], "ab") as f:
+            pickle.dump(buffers[bucket], f, protocol=pickle.HIGHEST_PROTOCOL)
+        buffered[0] -= buffer_sizes[bucket]
+        buffers[bucket] = []
+        buffer_sizes[bucket] = 0
+
+    num_rows = 0
+    for row_num, row in enumerate(rows, start=1):
+        key = encode_sort_key(row, sorted(row) if sort_keys is None else sort_keys, key_types)
+        bucket = zlib.crc32(key) % num_buckets
+        buffers[bucket].append((key, row_num, row))
+        row_size = estimate_row_size(row) + sys.getsizeof(key)
+        buffer_sizes[bucket] += row_size
+        buffered[0] += row_size
+        # A bucket is written once it holds flush_mb, so each open appends a sizeable batch
+        if buffer_sizes[bucket] >= flush_size:
+            flush(bucket)
+        elif buffered[0] >= memory_budget:
+            # Over budget: write out the fullest buckets until half the budget is free
+            for fullest in sorted(range(num_buckets), key=buffer_sizes.__getitem__, reverse=True):
+                if buffered[0] < memory_budget // 2:
+                    break
+                flush(fullest)
+        num_rows = row_num
+    for bucket in range(num_buckets):
+        if buffers[bucket]:
+            flush(bucket)
+    return bucket_paths, num_rows
+
+
+def compare_bucket_pair(bucket_path1, bucket_path2, spill_dir):
+    """Join one pair of buckets on their keys; returns (only in file1, only in file2, diff run path) (worker)."""
+    groups1 = {}
+    groups2 = {}
+    for bucket_path, groups in ((bucket_path1, groups1), (bucket_path2, groups2)):
+        if not os.path.exists(bucket_path):
+            continue
+        for key, row_num, row in read_sorted_run(bucket_path):
+            groups.setdefault(key, []).append((row_num, row))
+
+    full_rows1 = {
+        fingerprint_values([row[col] for col in sorted(row)])
+        for group in groups1.values() for _, row in group
+    }
+    full_rows2 = {
+        fingerprint_values([row[col] for col in sorted(row)])
+        for group in groups2.values() for _, row in group
+    }
+
+    row_pairs = (
+        row_pair
+        for key in groups1.keys() | groups2.keys()
+        for row_pair in pair_key_group(groups1.get(key, []), groups2.get(key, []))
+    )
+    # Spill the diff rows keyed on their file order, so the parent can merge the buckets
+    keyed_diff_rows = [
+        (
+            (
+                diff_row[0][0] if diff_row[0][0] is not None else float("inf"),
+                diff_row[0][1] if diff_row[0][1] is not None else float("inf"),
+            ),
+            diff_row,
+        )
+        for _, batch_diff_rows, _ in compare_row_pairs(row_pairs)
+        for diff_row in batch_diff_rows
+    ]
+    diff_run_path = write_sorted_run(keyed_diff_rows, spill_dir) if keyed_diff_rows else None
 
-        if val1 != val2:
-            row_diff = True
-            diff_cols.append(col)
+    return len(full_rows1 - full_rows2), len(full_rows2 - full_rows1), diff_run_path
 
-    return row_diff, diff_cols, row1, row2
 
-def read_file(file_path, column_mapping=None):
+def hash_compare_rows(rows1, rows2, sort_keys, bucket_dir, num_buckets=None, workers=None, memory_budget_mb=512, key_types=None, file_size=0):
+    """Compare two row streams bucket by bucket without sorting either file."""
+    workers = workers or os.cpu_count()
+    if num_buckets is None:
+        # One bucket pair per worker within memory_budget_mb; parsed rows take about 8x their size on disk
+        bytes_per_worker = memory_budget_mb * 1024 * 1024 // workers
+        num_buckets = max(4 * workers, file_size * 8 // max(bytes_per_worker, 1) + 1)
+
+    bucket_paths1, num_rows1 = partition_rows(
+        rows1, sort_keys, num_buckets, bucket_dir, "file1", key_types, memory_budget_mb
+    )
+    bucket_paths2, num_rows2 = partition_rows(
+        rows2, sort_keys, num_buckets, bucket_dir, "file2", key_types, memory_budget_mb
+    )
+
+    only_in_file1 = 0
+    only_in_file2 = 0
+    diff_run_paths = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        for bucket_only1, bucket_only2, diff_run_path in executor.map(
+            compare_bucket_pair, bucket_paths1, bucket_paths2, itertools.repeat(bucket_dir)
+        ):
+            only_in_file1 += bucket_only1
+            only_in_file2 += bucket_only2
+            if diff_run_path is not None:
+                diff_run_paths.append(diff_run_path)
+
+    # Report the differences in file order; the runs in bucket_dir must be read before it is removed
+    diff_rows = (diff_row for _, diff_row in merge_sorted_runs(diff_run_paths))
+    return num_rows1, num_rows2, only_in_file1, only_in_file2, diff_rows
+   # ................................................................................................... 
+def fetch_delimiter(file_path):
     _, file_extension = os.path.splitext(file_path)
-    if file_extension == ".csv":
-        for chunk in pd.read_csv(file_path, chunksize=10000, dtype=str, delimiter=","):
+    if file_extension == ".csv" or file_extension == ".dat":
+        with open(file_path, "r") as file:
+            dialect = csv.Sniffer().sniff(file.read(102400))
+            return dialect.delimiter
+
+
+def read_file(file_path, column_mapping=None, parse_workers=1):
+    _, file_extension = os.path.splitext(file_path)
+    if parse_workers > 1 and file_extension in (".csv", ".dat"):
+        delimiter = "," if file_extension == ".csv" else fetch_delimiter(file_path)
+        for header, columns in read_file_parallel(file_path, delimiter, column_mapping, parse_workers):
+            for values in zip(*columns):
+                yield dict(zip(header, values))
+    elif file_extension in (".csv", ".dat"):
+        delimiter = "," if file_extension == ".csv" else fetch_delimiter(file_path)
+        for chunk in pd.read_csv(file_path, chunksize=10000, dtype=str, delimiter=delimiter):
             if column_mapping:
                 chunk = chunk.rename(columns=column_mapping)
             for row in chunk.to_dict("records"):
@@ -135,6 +1166,179 @@ def read_file(file_path, column_mapping=None):
         raise ValueError("Unsupported file format")
 
 
+def read_file_columnar(file_path, column_mapping=None, chunk_size=10000, parse_workers=1):
+    """Yield (header, columns) batches with one NumPy array per column."""
+    _, file_extension = os.path.splitext(file_path)
+    if parse_workers > 1 and file_extension in (".csv", ".dat"):
+        delimiter = "," if file_extension == ".csv" else fetch_delimiter(file_path)
+        yield from read_file_parallel(file_path, delimiter, column_mapping, parse_workers)
+    elif file_extension in (".csv", ".dat"):
+        delimiter = "," if file_extension == ".csv" else fetch_delimiter(file_path)
+        header = None
+        for chunk in pd.read_csv(file_path, chunksize=chunk_size, dtype=str, delimiter=delimiter):
+            if column_mapping:
+                chunk = chunk.rename(columns=column_mapping)
+            if header is None:
+                header = list(chunk.columns)
+            yield header, [chunk.iloc[:, i].to_numpy(dtype=object) for i in range(len(header))]
+    elif file_extension == ".xlsx":
+        wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+        for sheet_name in wb.sheetnames:
+            sheet = wb[sheet_name]
+            header = [cell.value for cell in sheet[1]]
+            if column_mapping:
+                header = [column_mapping.get(col, col) for col in header]
+            for batch in chunks(sheet.iter_rows(min_row=2, values_only=True), chunk_size):
+                yield header, [np.array([row[i] for row in batch], dtype=object) for i in range(len(header))]
+    else:
+        raise ValueError("Unsupported file format")
+
+
+def concat_column_batches(batches):
+    """Stitch the batches of read_file_columnar into whole-file column arrays."""
+    header = None
+    parts = []
+    for batch_header, columns in batches:
+        if header is None:
+            header = batch_header
+        elif batch_header != header:
+            raise ValueError("Column batches do not share the same header")
+        parts.append(columns)
+
+    if header is None or sum(len(columns[0]) for columns in parts if columns) == 0:
+        raise ValueError("One or both files are empty")
+
+    return header, [np.concatenate([columns[i] for columns in parts]) for i in range(len(header))]
+
+
+def columnar_sort_keys(header, columns, num_rows, sort_keys=None, key_types=None):
+    """Encoded sort key of every row of a set of column arrays, as encode_sort_key builds it for a row."""
+    keys = header if sort_keys is None else sort_keys
+    key_types = key_types or {}
+    key_columns = [columns[header.index(key)] for key in keys]
+    encoded_keys = np.empty(num_rows, dtype=object)
+    encoded_keys[:] = [
+        b"".join(encode_sort_value(value, key_types.get(key)) for key, value in zip(keys, values))
+        for values in zip(*key_columns)
+    ]
+    return encoded_keys
+
+
+def column_row(header, columns, row_index):
+    """One row of a set of column arrays as a dict."""
+    return {col: columns[i][row_index] for i, col in enumerate(header)}
+
+
+def index_key_groups(keys):
+    """Yield (key, row indices) for each run of equal keys in a sorted key array."""
+    start = 0
+    for key, group in itertools.groupby(keys):
+        stop = start + sum(1 for _ in group)
+        yield key, range(start, stop)
+        start = stop
+
+
+def pair_index_group(indices1, indices2, fingerprints1, fingerprints2):
+    """pair_key_group for row indices: identical rows (by fingerprint) cancel out first."""
+    if len(indices1) == 1 and len(indices2) == 1:
+        yield indices1[0], indices2[0]
+        return
+
+    remaining2 = {}
+    for row_index in indices2:
+        remaining2.setdefault(fingerprints2[row_index], []).append(row_index)
+    unmatched1 = []
+    for row_index in indices1:
+        identical_rows = remaining2.get(fingerprints1[row_index])
+        if identical_rows:
+            identical_rows.pop(0)
+        else:
+            unmatched1.append(row_index)
+    unmatched2 = sorted(row_index for indices in remaining2.values() for row_index in indices)
+    yield from itertools.zip_longest(unmatched1, unmatched2)
+
+
+def merge_join_indices(keys1, keys2, fingerprints1, fingerprints2):
+    """merge_join_rows for sorted key arrays: yields (row index 1, row index 2) pairs, None if missing."""
+    groups1 = index_key_groups(keys1)
+    groups2 = index_key_groups(keys2)
+    group1 = next(groups1, None)
+    group2 = next(groups2, None)
+    while group1 is not None or group2 is not None:
+        if group2 is None or (group1 is not None and group1[0] < group2[0]):
+            yield from pair_index_group(group1[1], [], fingerprints1, fingerprints2)
+            group1 = next(groups1, None)
+        elif group1 is None or group2[0] < group1[0]:
+            yield from pair_index_group([], group2[1], fingerprints1, fingerprints2)
+            group2 = next(groups2, None)
+        else:
+            yield from pair_index_group(group1[1], group2[1], fingerprints1, fingerprints2)
+            group1 = next(groups1, None)
+            group2 = next(groups2, None)
+
+
+def compare_index_pairs(header, columns1, columns2, index_pairs, batch_size=10000):
+    """compare_row_pairs for (row index 1, row index 2) pairs of two sets of column arrays."""
+    # Row dicts are only built for the diff rows
+    index_pairs = iter(index_pairs)
+    while True:
+        batch = list(itertools.islice(index_pairs, batch_size))
+        if not batch:
+            return
+
+        paired = [pair for pair in batch if pair[0] is not None and pair[1] is not None]
+        column_counts = {}
+        changed = {}
+        if paired:
+            take1 = np.array([row_index1 for row_index1, _ in paired], dtype=np.intp)
+            take2 = np.array([row_index2 for _, row_index2 in paired], dtype=np.intp)
+            bitmask, counts = compare_column_batch(
+                [column[take1] for column in columns1], [column[take2] for column in columns2]
+            )
+            column_counts = {col: int(count) for col, count in zip(header, counts) if count}
+            for pair_index in np.flatnonzero(bitmask.any(axis=1)):
+                changed[paired[pair_index]] = mismatch_columns(header, bitmask[pair_index])
+
+        diff_rows = []
+        for row_index1, row_index2 in batch:
+            row_num = (
+                row_index1 + 1 if row_index1 is not None else None,
+                row_index2 + 1 if row_index2 is not None else None,
+            )
+            if row_index2 is None:
+                diff_rows.append((row_num, list(header), column_row(header, columns1, row_index1), None))
+            elif row_index1 is None:
+                diff_rows.append((row_num, list(header), None, column_row(header, columns2, row_index2)))
+            elif (row_index1, row_index2) in changed:
+                diff_rows.append(
+                    (
+                        row_num,
+                        changed[(row_index1, row_index2)],
+                        column_row(header, columns1, row_index1),
+                        column_row(header, columns2, row_index2),
+                    )
+                )
+        yield len(batch), diff_rows, column_counts
+
+
+def compare_column_arrays(header, columns1, columns2, num_rows, batch_size=10000):
+    """Yield (diff rows, columns with differences) per batch of sorted column arrays compared by position."""
+    for start in range(0, num_rows, batch_size):
+        stop = min(start + batch_size, num_rows)
+        bitmask, counts = compare_column_batch(
+            [column[start:stop] for column in columns1], [column[start:stop] for column in columns2]
+        )
+
+        diff_rows = []
+        for offset in np.flatnonzero(bitmask.any(axis=1)):
+            row_index = start + int(offset)
+            diff_cols = mismatch_columns(header, bitmask[offset])
+            row1 = column_row(header, columns1, row_index)
+            row2 = column_row(header, columns2, row_index)
+            diff_rows.append((row_index + 1, diff_cols, row1, row2))
+        yield diff_rows, {header[i] for i in np.flatnonzero(counts)}
+
+
 def mixed_type_sort_key(row, keys=None):
     if keys is None:
         keys = row.keys()  # Use all keys if none are specified
@@ -150,16 +1354,77 @@ def mixed_type_sort_key(row, keys=None):
 
 
 def compare_csv_files(
-    file1, file2, outfile, sort_keys=None, exclude_keys=None, column_mapping=None
+    file1,
+    file2,
+    outfile,
+    sort_keys=None,
+    exclude_keys=None,
+    column_mapping=None,
+    ingest="rows",
+    parse_workers=1,
+    sort_mode="memory",
+    memory_budget_mb=512,
+    spill_dir=None,
+    sort_workers=None,
+    key_types=None,
+    engine="sort",
+    compare_workers=None,
+    num_buckets=None,
+    match="key",
+    preflight=True,
+    markup="css",
+    report="table",
+    inline_rows=1000,
+    shard_rows=5000,
+    diff_output=None,
 ):
     print(sort_keys)
     print(type(sort_keys))
+    # The artifact's key_ columns follow include= as given; match=key may default sort_keys later
+    key_columns = sort_keys
+    if ingest == "columnar" and (engine != "sort" or sort_mode != "memory"):
+        # The columnar path holds and sorts both files in memory itself
+        raise ValueError(
+            "ingest=columnar cannot be combined with engine=hash or sort_mode=external/sample"
+        )
+    if engine == "hash" and match == "position":
+        # Buckets are joined on their keys, so there are no positions to pair rows on
+        raise ValueError("engine=hash always matches rows by key; use engine=sort with match=position")
+    if diff_output and pa is None:
+        # Fail before the files are parsed rather than when the first diff rows are written
+        raise ImportError("diff_output= needs pyarrow; install it with pip install pyarrow")
     usr_exclusion_msg = (
         f"Columns to be excluded in comparison based on user input: {', '.join(exclude_keys)}"
         if exclude_keys
         else "Columns to be excluded in comparison based on user input: None"
     )
 
+    # Equivalent files skip parsing, sorting and the diff table altogether
+    if preflight:
+        equivalence = files_equivalent(file1, file2, column_mapping)
+        if equivalence is not None:
+            reason, num_records, preflight_header = equivalence
+            preflight_msg = f"{file1} and {file2} are {reason}, so no rows were compared"
+            print(f"{preflight_msg}. Please check the generated HTML for more details.")
+            preflight_html_msg = (
+                f"<ul>"
+                f"<li><span style='color: orange; font-size: 14px; font-family: Arial; font-weight: bold;'>{usr_exclusion_msg}</span></li>"
+                f"<li><span style='color: orange; font-size: 14px; font-family: Arial; font-weight: bold;'>{preflight_msg}</span></li>"
+                f"</ul>"
+            )
+            with open(outfile, "w") as out:
+                out.write(
+                    report_header_html()
+                    + comparison_summary_html(
+                        file1, file2, num_records, 0, 0, 0, preflight_html_msg
+                    )
+                )
+            if diff_output:
+                # Downstream jobs still get an artifact, just with no rows
+                header = [col for col in preflight_header if col not in (exclude_keys or [])]
+                diff_artifact_writer(diff_output, header, key_columns, file1, file2)[1]()
+            return
+
     # Initialize counters
     num_records = 0
     num_diff_records = 0
@@ -167,21 +1432,33 @@ def compare_csv_files(
     num_records_file2_not_in_file1 = 0
 
     # Open the input files and output file for writing HTML table
-    with open(file1, "r") as f1, open(file2, "r") as f2, open(outfile, "w") as outfile:
-        rows1 = read_file(file1, column_mapping)
-        rows2 = read_file(file2, column_mapping)
+    report_path = outfile
+    with open(file1, "r") as f1, open(file2, "r") as f2, open(
+        outfile, "w"
+    ) as outfile, tempfile.TemporaryDirectory(dir=spill_dir) as spill_root:
+        if ingest == "columnar":
+            # Keep both files as typed column arrays instead of one dict per row
+            header1, columns1 = concat_column_batches(
+                read_file_columnar(file1, column_mapping, parse_workers=parse_workers)
+            )
+            header2, columns2 = concat_column_batches(
+                read_file_columnar(file2, column_mapping, parse_workers=parse_workers)
+            )
+        else:
+            rows1 = read_file(file1, column_mapping, parse_workers)
+            rows2 = read_file(file2, column_mapping, parse_workers)
 
-        try:
-            first_row1 = next(rows1)
-            first_row2 = next(rows2)
-        except StopIteration:
-            raise ValueError("One or both files are empty")
+            try:
+                first_row1 = next(rows1)
+                first_row2 = next(rows2)
+            except StopIteration:
+                raise ValueError("One or both files are empty")
 
-        rows1 = itertools.chain([first_row1], rows1)
-        rows2 = itertools.chain([first_row2], rows2)
+            rows1 = itertools.chain([first_row1], rows1)
+            rows2 = itertools.chain([first_row2], rows2)
 
-        header1 = list(first_row1.keys())
-        header2 = list(first_row2.keys())
+            header1 = list(first_row1.keys())
+            header2 = list(first_row2.keys())
 
         mismatch_column_headers = list(set(header1) - set(header2)) + list(
             (set(header2) - set(header1))
@@ -219,240 +1496,465 @@ def compare_csv_files(
             f"</ul>"
         )
 
-        # Exclude the specified columns
-        if len(exclude_keys) > 0:
-            rows1 = [
-                {k: v for k, v in row.items() if k not in exclude_keys} for row in rows1
-            ]
-            rows2 = [
-                {k: v for k, v in row.items() if k not in exclude_keys} for row in rows2
-            ]
-
-        # Check if both files have same headers/fieldnames
-        if header1 != header2:
-            # raise ValueError("Headers not matching in both files")
-            pass
-
-        header1 = (
-            header1
-            if not exclude_keys
-            else [item for item in header1 if item not in exclude_keys]
-        )
-        print(header1)
-
-        # Parallel sorting using ThreadPoolExecutor
-        with ThreadPoolExecutor() as executor:
-            future1 = executor.submit(parallel_sort_rows, rows1, sort_keys)
-            future2 = executor.submit(parallel_sort_rows, rows2, sort_keys)
-
-            sorted_rows1 = future1.result()
-            sorted_rows2 = future2.result()
-                    
-        # Count the number of records in each file
-        num_records = len(sorted_rows1)
-        print(num_records)
-
-        # Initialize HTML string with a table
-        html = "<html>\n<head>\n<style>\nbody {font-family: Helvetica;}\n</style>\n</head>\n<body>\n"
-
-        # Read the contents of output.csv
-        with open("output.csv", "r") as file:
-            csv_content = [line.strip() for line in file if line.strip()]
-
-        # Check if both lines contain ": 0"
-        recon_status = all(": 0" in line for line in csv_content)
-
-        # Encode the contents as Base64
-        csv_base64 = base64.b64encode("".join(csv_content).encode()).decode("utf-8")
-
-        # Embed the CSV as a data URI
-        html += '<div style="font-family: Helvetica, sans-serif; margin-top: 20px;">\n'
-        html += '<table style="border-collapse: collapse;">'
-
-        # Add the recon status to the HTML
-        if recon_status:
-            html += '<th colspan="100" style="color: green; font-weight: bold;">Recon Status: OK</th></tr>'
+        if ingest == "columnar":
+            num_records = len(columns1[0])
+            num_records2 = len(columns2[0])
+
+            # Exclude the specified columns and line file2 up with the header order of file1
+            kept_columns = [col for col in header1 if col not in exclude_keys]
+            columns1 = [columns1[header1.index(col)] for col in kept_columns]
+            columns2 = [columns2[header2.index(col)] for col in kept_columns]
+            header1 = kept_columns
+            print(header1)
+
+            # Sort by reordering the column arrays instead of moving row dicts around
+            encoded_keys1 = columnar_sort_keys(header1, columns1, num_records, sort_keys, key_types)
+            encoded_keys2 = columnar_sort_keys(header1, columns2, num_records2, sort_keys, key_types)
+            order1 = np.argsort(encoded_keys1, kind="stable")
+            order2 = np.argsort(encoded_keys2, kind="stable")
+            columns1 = [column[order1] for column in columns1]
+            columns2 = [column[order2] for column in columns2]
+            encoded_keys1 = encoded_keys1[order1]
+            encoded_keys2 = encoded_keys2[order2]
+            print(num_records)
+        elif engine == "hash":
+            # Exclude the specified columns row by row so nothing is held in memory
+            if len(exclude_keys) > 0:
+                rows1 = (
+                    {k: v for k, v in row.items() if k not in exclude_keys} for row in rows1
+                )
+                rows2 = (
+                    {k: v for k, v in row.items() if k not in exclude_keys} for row in rows2
+                )
+
+            header1 = [item for item in header1 if item not in exclude_keys]
+            print(header1)
+
+            # Hash-partition both files on the include= keys and join bucket pairs
+            (
+                num_records,
+                num_records2,
+                num_records_file1_not_in_file2,
+                num_records_file2_not_in_file1,
+                hash_diff_rows,
+            ) = hash_compare_rows(
+                rows1,
+                rows2,
+                sort_keys,
+                spill_root,
+                num_buckets=num_buckets,
+                workers=compare_workers,
+                memory_budget_mb=memory_budget_mb,
+                key_types=key_types,
+                file_size=os.path.getsize(file1) + os.path.getsize(file2),
+            )
+            print(num_records)
+        elif sort_mode == "external":
+            # Exclude the specified columns row by row so nothing is held in memory
+            if len(exclude_keys) > 0:
+                rows1 = (
+                    {k: v for k, v in row.items() if k not in exclude_keys} for row in rows1
+                )
+                rows2 = (
+                    {k: v for k, v in row.items() if k not in exclude_keys} for row in rows2
+                )
+
+            header1 = [item for item in header1 if item not in exclude_keys]
+            print(header1)
+            if match == "key" and sort_keys is None:
+                sort_keys = header1  # Key both files on the same column order
+
+            # Sort both files into runs on disk; rows are streamed back from there
+            run_paths1, num_records = external_sort_rows(
+                rows1, sort_keys, memory_budget_mb, spill_root, key_types, header1
+            )
+            run_paths2, num_records2 = external_sort_rows(
+                rows2, sort_keys, memory_budget_mb, spill_root, key_types, header1
+            )
+            print(num_records)
         else:
-            html += '<th colspan="100" style="color: red; font-weight: bold;">Recon Status: NOK</th></tr>'
-
-        html += "<tr><td></td></tr>\n"
-        html += (
-            '<tr><td><a href="data:text/csv;base64,'
-            + csv_base64
-            + '" download="output.csv">Recon summary</a></td></tr>\n'
-        )
-        html += '<tr style="height: 20px;"><td></td></tr>\n'  # Add spacing of 20 pixels
-        html += "</table>\n"
-        html += "</div>\n"
-        html += (
-            '<tr><th style="border: 1px solid black;">Comparison Summary:-</th></tr>'
-        )
-        html += '<table style="border: 1px solid black; border-collapse: collapse;">\n'
+            # Exclude the specified columns
+            if len(exclude_keys) > 0:
+                rows1 = [
+                    {k: v for k, v in row.items() if k not in exclude_keys} for row in rows1
+                ]
+                rows2 = [
+                    {k: v for k, v in row.items() if k not in exclude_keys} for row in rows2
+                ]
+
+            # Check if both files have same headers/fieldnames
+            if header1 != header2:
+                # raise ValueError("Headers not matching in both files")
+                pass
+
+            header1 = (
+                header1
+                if not exclude_keys
+                else [item for item in header1 if item not in exclude_keys]
+            )
+            print(header1)
+            if match == "key" and sort_keys is None:
+                sort_keys = header1  # Key both files on the same column order
+
+            # Both sorts return (encoded key, row) pairs; the key join reuses the keys
+            if sort_mode == "sample":
+                # Each file is spread over all the worker processes in turn
+                keyed_sorted1 = sample_sort_rows(
+                    rows1, sort_keys, sort_workers, key_types=key_types
+                )
+                keyed_sorted2 = sample_sort_rows(
+                    rows2, sort_keys, sort_workers, key_types=key_types
+                )
+            else:
+                # Parallel sorting using ThreadPoolExecutor
+                with ThreadPoolExecutor() as executor:
+                    future1 = executor.submit(
+                        parallel_sort_rows, rows1, sort_keys, key_types
+                    )
+                    future2 = executor.submit(
+                        parallel_sort_rows, rows2, sort_keys, key_types
+                    )
+
+                    keyed_sorted1 = future1.result()
+                    keyed_sorted2 = future2.result()
+            sorted_rows1 = [row for _, row in keyed_sorted1]
+            sorted_rows2 = [row for _, row in keyed_sorted2]
+
+            # Fingerprint every row once; counts and pair skipping use these
+            fingerprints1 = row_fingerprints(sorted_rows1, header1)
+            fingerprints2 = row_fingerprints(sorted_rows2, header1)
+
+            # Count the number of records in each file
+            num_records = len(sorted_rows1)
+            print(num_records)
 
         # Compare each row from both files
+        if ingest != "columnar" and engine == "hash":
+            num_diff_records = (
+                num_records_file1_not_in_file2 + num_records_file2_not_in_file1
+            )
+        elif ingest != "columnar" and sort_mode == "external":
+            (
+                num_records_file1_not_in_file2,
+                num_records_file2_not_in_file1,
+            ) = count_sorted_run_differences(run_paths1, run_paths2)
+            num_diff_records = (
+                num_records_file1_not_in_file2 + num_records_file2_not_in_file1
+            )
+        else:
+            if ingest == "columnar":
+                fingerprints1 = column_fingerprints(columns1)
+                fingerprints2 = column_fingerprints(columns2)
+            (
+                num_records_file1_not_in_file2,
+                num_records_file2_not_in_file1,
+            ) = count_fingerprint_differences(fingerprints1, fingerprints2)
+            num_diff_records = (
+                num_records_file1_not_in_file2 + num_records_file2_not_in_file1
+            )
 
-        sorted_rows1_set = set(
-            tuple(sorted(sorted_row.items())) for sorted_row in sorted_rows1
-        )
-        sorted_rows2_set = set(
-            tuple(sorted(sorted_row.items())) for sorted_row in sorted_rows2
-        )
-        num_diff_records = len(sorted_rows1_set.symmetric_difference(sorted_rows2_set))
-        num_records_file1_not_in_file2 = len(
-            sorted_rows1_set.difference(sorted_rows2_set)
-        )
-        num_records_file2_not_in_file1 = len(
-            sorted_rows2_set.difference(sorted_rows1_set)
-        )
-
-        # Generate HTML for comparison summary
-        summary_html = '<div style="font-size: 15px;">'
-        summary_html += f"<p>Total Records in each file: {num_records}</p>"
-        summary_html += (
-            f"<p>Number of Rows with Differences: {int(num_diff_records)}</p>"
+        # Write the recon status and summary first so they survive an interrupted run
+        outfile.write(report_header_html())
+        outfile.write(
+            comparison_summary_html(
+                file1,
+                file2,
+                num_records,
+                num_diff_records,
+                num_records_file1_not_in_file2,
+                num_records_file2_not_in_file1,
+                combined_html_msg,
+            )
         )
-        summary_html += f"<p>Number of records from {file1} differ from {file2}:  {num_records_file1_not_in_file2}</p>"
-        summary_html += f"<p>Number of records from {file2} differ from {file1}:  {num_records_file2_not_in_file1}</p>"
-        summary_html += f"<p>Please Note: {combined_html_msg}</p>"
-        summary_html += "</div>\n"
-
-        # Add the summary HTML to the start of the HTML string
-        html += summary_html
+        outfile.flush()
 
         # Check if there are any differences in the data and generate HTML table for differences
         if num_diff_records == 0:
             print(
                 f"{file1} and {file2} have no differences. Please check the generated HTML for more details."
             )
+            if diff_output:
+                diff_artifact_writer(diff_output, header1, key_columns, file1, file2)[1]()
         elif num_diff_records > 0:
             print(
                 f"{file1} and {file2} have differences by {num_diff_records}. Please check the generated HTML for more details."
             )
 
-            diff_rows = []
             diff_columns = set()
 
-            # Compare each row from both files and add different rows to diff_rows list
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                futures = []
-                for row1, row2 in zip(sorted_rows1, sorted_rows2):
-                    future = executor.submit(parallel_compare_rows, row1, row2)
-                    futures.append(future)
-
-                diff_rows = []
-                diff_columns = set()
-
-                for row_num, future in enumerate(futures, start=1):
-                    row_diff, diff_cols, row1, row2 = future.result()
+            # Diff rows are streamed into the table (and shards) a batch at a time
+            write_batch, finish_table = diff_report_writer(
+                outfile,
+                report_path,
+                file1,
+                file2,
+                header1,
+                markup=markup,
+                report=report,
+                inline_rows=inline_rows,
+                shard_rows=shard_rows,
+            )
+            if diff_output:
+                # The machine-readable artifact gets the same batches as the HTML
+                write_batch, finish_table = combine_writers(
+                    (write_batch, finish_table),
+                    diff_artifact_writer(diff_output, header1, key_columns, file1, file2),
+                )
+
+            if ingest == "columnar" and match != "key":
+                for batch_diff_rows, batch_diff_columns in compare_column_arrays(
+                    header1, columns1, columns2, min(num_records, num_records2)
+                ):
+                    write_batch(batch_diff_rows)
+                    diff_columns.update(batch_diff_columns)
+            elif engine == "hash":
+                for batch_diff_rows in chunks(hash_diff_rows, 10000):
+                    write_batch(batch_diff_rows)
+                    for diff_row in batch_diff_rows:
+                        diff_columns.update(diff_row[1])
+            else:
+                # Pairs are counted before the fingerprint filter so progress covers every row
+                num_scanned = [0]
+                if match == "key" and ingest == "columnar":
+                    # Join the sorted key arrays on row indices; dicts are only
+                    # built for the rows that end up in the report
+                    index_pairs = count_items(
+                        merge_join_indices(encoded_keys1, encoded_keys2, fingerprints1, fingerprints2),
+                        num_scanned,
+                    )
+                    # Pairs whose fingerprints match are identical rows
+                    index_pairs = (
+                        (row_index1, row_index2)
+                        for row_index1, row_index2 in index_pairs
+                        if row_index1 is None
+                        or row_index2 is None
+                        or fingerprints1[row_index1] != fingerprints2[row_index2]
+                    )
+                    pair_batches = compare_index_pairs(header1, columns1, columns2, index_pairs)
+                elif match == "key":
+                    # Walk both sorted files on their keys so one inserted row
+                    # does not shift every following pair
+                    if sort_mode == "external":
+                        # Run keys are (match key, row fingerprint) pairs; join on the match key
+                        keyed_stream1 = (
+                            (key[0], row) for key, row in merge_sorted_runs(run_paths1)
+                        )
+                        keyed_stream2 = (
+                            (key[0], row) for key, row in merge_sorted_runs(run_paths2)
+                        )
+                    else:
+                        keyed_stream1 = keyed_sorted1
+                        keyed_stream2 = keyed_sorted2
+                    row_pairs = count_items(
+                        merge_join_rows(keyed_stream1, keyed_stream2), num_scanned
+                    )
+                    if sort_mode != "external":
+                        # Pairs whose fingerprints match are identical rows
+                        row_pairs = (
+                            (row_num, row1, row2)
+                            for row_num, row1, row2 in row_pairs
+                            if row1 is None
+                            or row2 is None
+                            or fingerprints1[row_num[0] - 1] != fingerprints2[row_num[1] - 1]
+                        )
+                elif sort_mode == "external":
+                    # Stream both merged runs side by side
+                    row_pairs = (
+                        (row_num, row1, row2)
+                        for row_num, (row1, row2) in enumerate(
+                            count_items(
+                                zip(
+                                    (row for _, row in merge_sorted_runs(run_paths1)),
+                                    (row for _, row in merge_sorted_runs(run_paths2)),
+                                ),
+                                num_scanned,
+                            ),
+                            start=1,
+                        )
+                    )
+                else:
+                    # Only pairs whose fingerprints differ need a full comparison
+                    row_pairs = (
+                        (row_num, row1, row2)
+                        for row_num, (row1, row2, fingerprint1, fingerprint2) in enumerate(
+                            count_items(
+                                zip(sorted_rows1, sorted_rows2, fingerprints1, fingerprints2),
+                                num_scanned,
+                            ),
+                            start=1,
+                        )
+                        if fingerprint1 != fingerprint2
+                    )
+
+                # Compare the row pairs a batch of column arrays at a time
+                if not (match == "key" and ingest == "columnar"):
+                    pair_batches = compare_row_pairs(row_pairs)
+                num_changed = num_only_in_file1 = num_only_in_file2 = 0
+                column_mismatches = {}
+                for _, batch_diff_rows, column_counts in pair_batches:
+                    write_batch(batch_diff_rows)
+                    for diff_row in batch_diff_rows:
+                        diff_columns.update(diff_row[1])
+                        if diff_row[3] is None:
+                            num_only_in_file1 += 1
+                        elif diff_row[2] is None:
+                            num_only_in_file2 += 1
+                        else:
+                            num_changed += 1
+                    for col, count in column_counts.items():
+                        column_mismatches[col] = column_mismatches.get(col, 0) + count
 
-                    if row_diff:
-                        diff_rows.append((row_num, diff_cols, row1, row2))
-                        diff_columns.update(diff_cols)
-                    
                     # Calculate and print the progress in percentage
-                    progress = row_num / num_records * 100
+                    progress = min(num_scanned[0] / max(num_records, 1) * 100, 100)
                     print(f"\rComparison progress: {progress:.2f}%", end="")
+                print("\rComparison progress: 100.00%")
 
-            # Print the column names with differences below the HTML table
-            html += (
-                '<div style="font-family: Helvetica, sans-serif; margin-top: 20px;">\n'
-            )
-            html += '<table style="border-collapse: collapse;">'
-            html += '<tr style="background-color: #92b9bf; border: 1px solid black;"><th colspan="100" style="border: 1px solid black;">Columns with Differences:-</th></tr>'
-            for col in diff_columns:
-                html += f"<tr><td>{col}</td></tr>"
-            html += "</table>\n"
-            html += "</div>\n"
-
-            # Write the HTML table for differences to the output file
-            # Write the HTML table for differences to the output file
-            html += '<table style="font-family: Helvetica, sans-serif; font-size:14px;border-collapse: collapse; width: 100%; border: 1px solid black; border-spacing: 0px;">\n'
-            html += '<tr style="background-color: #a0d1dd; border: 1px solid black;"><th colspan="100" style="border: 1px solid black;">Differences</th></tr>'
-            html += '<tr style="background-color: #a0d1dd; border: 1px solid black;"><th style="border: 1px solid black;">File</th><th style="border: 1px solid black;">Row Number</th>'
-
-            # Write the headers of CSV files
-            for col in header1:
-                html += f'<th style="border: 1px solid black;">{col}</th>'
-
-            html += "</tr>\n"
-
-            # Write the rows with differences to the HTML file
-            for diff_row in diff_rows:
-                for i in range(2):  # Iterate twice for both files
-                    file_data = [(file1, diff_row[2]), (file2, diff_row[3])][i]
-                    file_name, row_data = file_data
-
-                    html += '<tr style="border: 1px solid black;">'
-
-                    # Write the file name and row number
-                    html += f'<td style="border: 1px solid black;">{file_name}</td>'
-                    html += f'<td style="border: 1px solid black;">{diff_row[0]}</td>'
-
-                    # Write the values of each column of the row
-                    for col in header1:
-                        cell_style = ''
-                        cell_value = row_data.get(col)
-
-                        if col in diff_row[1]:
-                            cell_style = 'background-color: #ffcfbf;font-weight: bold;'
-
-                        if pd.isnull(cell_value):
-                            cell_value = 'NULL'
-
-                        html += f'<td style="border: 1px solid black; {cell_style}">{cell_value}</td>'
-
-                    html += '</tr>\n'
+                if match == "key":
+                    print(
+                        f"Changed: {num_changed}, only in {file1}: {num_only_in_file1}, only in {file2}: {num_only_in_file2}"
+                    )
+                print(f"Mismatches per column: {column_mismatches}")
 
             # Close the HTML table
-            html += "</table>\n"
-        # Write the contents of the entire HTML string to the output file
-        outfile.write(html)
-
-
-# Extract sort_keys from system arguments
-column_mapping = None
-sort_keys = None
-exclude_keys = None
-for arg in sys.argv:
-    if "include=" in arg:
-        _, value = arg.split("=")
-        if value.lower() != "none":
-            if value == "*":
-                # Read the headers from the first file
-                with open(sys.argv[1], "r") as f:
-                    rows = read_file(sys.argv[1])
-                    first_row = next(rows)
-                    sort_keys = list(first_row.keys())
-            else:
-                sort_keys = value.split(";")
-    elif "exclude=" in arg:
-        _, value = arg.split("=")
-        exclude_keys = value.split(";")
-    elif arg.startswith("column_mapping="):
-        _, value = arg.split("=")
-        if value.lower() == "y":
-            with open("mapping.txt", "r") as f:
-                column_mapping = {}
-                lines = f.readlines()
-                for line in lines:
-                    mapping = line.strip().split(":")
-                    if len(mapping) == 2:
-                        src_cols = mapping[0].split(",")
-                        dest_cols = mapping[1].split(",")
-                        for src_col, dest_col in zip(src_cols, dest_cols):
-                            column_mapping[dest_col] = src_col
-        else:
-            column_mapping = None
-
+            finish_table()
 
-compare_csv_files(
-    sys.argv[1],
-    sys.argv[2],
-    sys.argv[3],
-    sort_keys=sort_keys,
-    exclude_keys=exclude_keys,
-    column_mapping=column_mapping,
-)
+            # Print the column names with differences below the HTML table
+            outfile.write(diff_columns_html(diff_columns))
+
+
+if __name__ == "__main__":
+    # Extract sort_keys from system arguments
+    column_mapping = None
+    sort_keys = None
+    exclude_keys = None
+    ingest = "rows"
+    parse_workers = 1
+    sort_mode = "memory"
+    memory_budget_mb = 512
+    spill_dir = None
+    sort_workers = None
+    key_types = None
+    engine = "sort"
+    compare_workers = None
+    num_buckets = None
+    match = "key"
+    preflight = True
+    markup = "css"
+    report = "table"
+    inline_rows = 1000
+    shard_rows = 5000
+    diff_output = None
+    for arg in sys.argv:
+        if "include=" in arg:
+            _, value = arg.split("=")
+            if value.lower() != "none":
+                if value == "*":
+                    # Read the headers from the first file
+                    with open(sys.argv[1], "r") as f:
+                        rows = read_file(sys.argv[1])
+                        first_row = next(rows)
+                        sort_keys = list(first_row.keys())
+                else:
+                    sort_keys = value.split(";")
+        elif "exclude=" in arg:
+            _, value = arg.split("=")
+            exclude_keys = value.split(";")
+        elif arg.startswith("column_mapping="):
+            _, value = arg.split("=")
+            if value.lower() == "y":
+                with open("mapping.txt", "r") as f:
+                    column_mapping = {}
+                    lines = f.readlines()
+                    for line in lines:
+                        mapping = line.strip().split(":")
+                        if len(mapping) == 2:
+                            src_cols = mapping[0].split(",")
+                            dest_cols = mapping[1].split(",")
+                            for src_col, dest_col in zip(src_cols, dest_cols):
+                                column_mapping[dest_col] = src_col
+            else:
+                column_mapping = None
+        elif arg.startswith("ingest="):
+            _, value = arg.split("=")
+            ingest = value.lower()
+        elif arg.startswith("parse_workers="):
+            _, value = arg.split("=")
+            parse_workers = int(value)
+        elif arg.startswith("sort_mode="):
+            _, value = arg.split("=")
+            sort_mode = value.lower()
+        elif arg.startswith("memory_budget_mb="):
+            _, value = arg.split("=")
+            memory_budget_mb = int(value)
+        elif arg.startswith("spill_dir="):
+            _, value = arg.split("=")
+            spill_dir = value
+        elif arg.startswith("sort_workers="):
+            _, value = arg.split("=")
+            sort_workers = int(value)
+        elif arg.startswith("key_types="):
+            _, value = arg.split("=")
+            key_types = {}
+            for item in value.split(";"):
+                col, key_type = item.rsplit(":", 1)
+                key_types[col] = key_type.lower()
+        elif arg.startswith("engine="):
+            _, value = arg.split("=")
+            engine = value.lower()
+        elif arg.startswith("compare_workers="):
+            _, value = arg.split("=")
+            compare_workers = int(value)
+        elif arg.startswith("num_buckets="):
+            _, value = arg.split("=")
+            num_buckets = int(value)
+        elif arg.startswith("match="):
+            _, value = arg.split("=")
+            match = value.lower()
+        elif arg.startswith("preflight="):
+            _, value = arg.split("=")
+            preflight = value.lower() not in ("n", "no", "false", "0")
+        elif arg.startswith("markup="):
+            _, value = arg.split("=")
+            markup = value.lower()
+        elif arg.startswith("report="):
+            _, value = arg.split("=")
+            report = value.lower()
+        elif arg.startswith("inline_rows="):
+            _, value = arg.split("=")
+            inline_rows = int(value)
+        elif arg.startswith("shard_rows="):
+            _, value = arg.split("=")
+            shard_rows = int(value)
+        elif arg.startswith("diff_output="):
+            _, value = arg.split("=")
+            diff_output = value
+
+
+    compare_csv_files(
+        sys.argv[1],
+        sys.argv[2],
+        sys.argv[3],
+        sort_keys=sort_keys,
+        exclude_keys=exclude_keys,
+        column_mapping=column_mapping,
+        ingest=ingest,
+        parse_workers=parse_workers,
+        sort_mode=sort_mode,
+        memory_budget_mb=memory_budget_mb,
+        spill_dir=spill_dir,
+        sort_workers=sort_workers,
+        key_types=key_types,
+        engine=engine,
+        compare_workers=compare_workers,
+        num_buckets=num_buckets,
+        match=match,
+        preflight=preflight,
+        markup=markup,
+        report=report,
+        inline_rows=inline_rows,
+        shard_rows=shard_rows,
+        diff_output=diff_output,
+    )
 
 
 """
@@ -463,4 +1965,15 @@ python comp1.py a.csv b.csv output.html include=none
 python comp1.py a.csv b.csv output.html include="Age;Gender;Last Name"
 python comp1.py a.xlsx b.xlsx output.html include="First Name;Last Name" exclude="Gender;Country"
 python comp2.py a.csv b.csv b.html column_mapping=y
+python final_comparison_performance_based.py a.csv b.csv output.html include="Account Number" ingest=columnar
+python final_comparison_performance_based.py a.dat b.dat output.html include="Account Number" parse_workers=8
+python final_comparison_performance_based.py a.csv b.csv output.html include="Account Number" sort_mode=external memory_budget_mb=2048 spill_dir=/tmp
+python final_comparison_performance_based.py a.csv b.csv output.html include="Account Number" sort_mode=sample sort_workers=32
+python final_comparison_performance_based.py a.csv b.csv output.html include="Amount;Transaction Date" key_types="Amount:float;Transaction Date:date"
+python final_comparison_performance_based.py a.csv b.csv output.html include="Account Number" engine=hash compare_workers=16
+python final_comparison_performance_based.py a.csv b.csv output.html include="Account Number" match=position
+python final_comparison_performance_based.py a.csv b.csv output.html include="Account Number" preflight=n
+python final_comparison_performance_based.py a.csv b.csv output.html include="Account Number" markup=minimal
+python final_comparison_performance_based.py a.csv b.csv output.html include="Account Number" report=paged inline_rows=500 shard_rows=5000
+python final_comparison_performance_based.py a.csv b.csv output.html include="Account Number" diff_output=diff.parquet report=none
 """
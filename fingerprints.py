@@ -0,0 +1,35 @@
+import datetime
+import hashlib
+import numbers
+import numpy as np
+import pandas as pd
+
+
+def canonical_value(value):
+    """Type-tagged, lossless and prefix-free bytes for one cell value."""
+    # Integral floats and bools encode as integers, since 1.0 == 1 == True
+    if not isinstance(value, str) and pd.isnull(value):
+        return b"\x00"
+    if isinstance(value, str):
+        tag, text = b"s", value
+    elif isinstance(value, (bool, np.bool_, numbers.Integral)):
+        tag, text = b"i", str(int(value))
+    elif isinstance(value, numbers.Real) and float(value).is_integer():
+        tag, text = b"i", str(int(value))
+    elif isinstance(value, numbers.Real):
+        tag, text = b"f", repr(float(value))
+    elif isinstance(value, datetime.datetime):
+        tag, text = b"t", value.isoformat()
+    elif isinstance(value, datetime.date):
+        tag, text = b"d", value.isoformat()
+    else:
+        tag, text = b"o", f"{type(value).__module__}.{type(value).__qualname__}:{value!r}"
+    encoded = text.encode("utf-8")
+    return tag + len(encoded).to_bytes(4, "big") + encoded
+
+
+def fingerprint_values(values):
+    """128-bit blake2b digest over the canonical encoding of a row's values."""
+    return hashlib.blake2b(
+        b"".join(canonical_value(value) for value in values), digest_size=16
+    ).digest()
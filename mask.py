@@ -1,11 +1,19 @@
 import pandas as pd
+import numpy as np
 import random
 import sys
 import os
+import io
+import itertools
+from concurrent.futures import ProcessPoolExecutor
 import warnings
 from datetime import datetime, timedelta
+from parallel_csv import ordered_results
 from masking_functions import (
     mask_functions,
+    column_mask_functions,
+    token_mask_functions,
+    Tokenizer,
     mask_default,
     first_names,
     last_names,
@@ -15,9 +23,13 @@ warnings.filterwarnings('ignore')
 
 
 class DataMasker:
-    def __init__(self):
+    def __init__(self, seed=None, tokenizer=None):
         self.first_names = first_names
         self.last_names = last_names
+        self.tokenizer = tokenizer
+        self.seed = seed
+        self.run_seed = seed
+        self.rng = np.random.default_rng(seed)
 
     def random_decimal(self, precision, scale):
         integer_part = random.randint(0, 10 ** (precision - scale) - 1)
@@ -67,82 +79,332 @@ class DataMasker:
             masked_number = account_number
         return masked_number
 
+    def column_masker(self, column_name, data_type, length, extra_params=None):
+        """Column form of mask_account_number: a (values, rng) -> masked values function, or None to keep the column."""
+        if extra_params is None:
+            extra_params = {}
+        data_type = data_type.upper()
+
+        if data_type in ["CHAR", "VARCHAR"]:
+            mask_function = mask_functions.get(column_name.upper(), mask_default)
+            if self.tokenizer is not None and mask_function in token_mask_functions:
+                # Same value, same token, in every file and run with this key
+                token_function = token_mask_functions[mask_function]
+                return lambda values, rng: self.tokenizer.mask_column(
+                    token_function, values, length, extra_params
+                )
+            column_function = column_mask_functions.get(mask_function)
+            if column_function is None:
+                # Maskers without a column version still run once per value
+                return lambda values, rng: np.array(
+                    [mask_function(str(value), length, extra_params) for value in values],
+                    dtype=object,
+                )
+            return lambda values, rng: column_function(values, length, extra_params, rng)
+        elif data_type == "DECIMAL":
+            precision, scale = length
+            if 10**precision > 2**63 - 1:
+                # Too wide for int64, fall back to Python integers
+                return lambda values, rng: np.array(
+                    [self.random_decimal(precision, scale) for _ in values], dtype=float
+                )
+
+            def mask_decimal(values, rng):
+                integer_part = rng.integers(0, 10 ** (precision - scale), size=len(values))
+                decimal_part = rng.integers(10 ** (scale - 1), 10**scale, size=len(values))
+                # One division of exact integers, so values match float(f"{i}.{d}")
+                return (integer_part * 10**scale + decimal_part) / 10**scale
+
+            return mask_decimal
+        elif data_type == "DATE":
+            start = np.datetime64("1900-01-01", "D")
+            num_days = int((np.datetime64("2099-12-31", "D") - start).astype(np.int64))
+            return lambda values, rng: np.datetime_as_string(
+                start + rng.integers(0, num_days + 1, size=len(values)), unit="D"
+            ).astype(object)
+        elif data_type == "TIMESTAMP":
+            start = np.datetime64("1900-01-01 00:00:00", "s")
+            num_seconds = int((np.datetime64("2099-12-31 23:59:59", "s") - start).astype(np.int64))
+
+            def mask_timestamp(values, rng):
+                timestamps = np.datetime_as_string(
+                    start + rng.integers(0, num_seconds + 1, size=len(values)), unit="s"
+                )
+                return np.char.add(np.char.replace(timestamps, "T", " "), ":000000").astype(object)
+
+            return mask_timestamp
+        elif data_type == "INTEGER":
+            if length is not None:
+                min_value = 10 ** (length - 1)
+                max_value = 10**length - 1
+            else:
+                min_value = extra_params.get("min_value", 0)
+                max_value = extra_params.get("max_value", 2**31 - 1)
+            if max_value >= 2**63 - 1:
+                # Too wide for int64, fall back to Python integers
+                return lambda values, rng: np.array(
+                    [random.randint(min_value, max_value) for _ in values], dtype=object
+                )
+            return lambda values, rng: rng.integers(min_value, max_value + 1, size=len(values))
+        return None
+
+    def compile_mask_plan(self, columns_to_mask, columns):
+        """(column name, column masker) for every column to mask, built once per run."""
+        plan = []
+        for column_name, (data_type, length, extra_params) in columns_to_mask.items():
+            if column_name != "FULL_NAME" and column_name in columns:
+                masker = self.column_masker(column_name, data_type, length, extra_params)
+                if masker is not None:
+                    plan.append((column_name, masker))
+        return plan
+
+    def mask_chunk(self, df, plan, rng=None):
+        """Mask one chunk of rows in place following a compiled plan."""
+        if rng is None:
+            rng = self.rng
+        for column_name, masker in plan:
+            df[column_name] = masker(df[column_name].to_numpy(dtype=object), rng)
+
+        if "FULL_NAME" in df.columns:
+            df["FULL_NAME"] = df["FIRST_NAME"] + " " + df["LAST_NAME"]
+        return df
+
+    def mask_tasks(self, chunks, reread_chunks, num_records, batch_size):
+        """Yield (chunk index, rows, number of rows to mask, write header) tasks; num_records=-1 masks every row."""
+        # Rows past the end of the file are sampled in batches of at most batch_size:
+        # a multinomial draw splits them over the chunks, which reread_chunks() reads again
+        chunk_index = 0
+        rows_read = 0
+        chunk_sizes = []
+        first_chunk = None
+        for chunk in chunks:
+            # Only the rows before num_records are masked
+            num_to_mask = (
+                len(chunk) if num_records == -1 or num_records > rows_read + len(chunk)
+                else max(num_records - rows_read, 0)
+            )
+            yield chunk_index, chunk, num_to_mask, chunk_index == 0
+            if first_chunk is None:
+                first_chunk = chunk
+            chunk_index += 1
+            rows_read += len(chunk)
+            chunk_sizes.append(len(chunk))
+
+        if num_records > rows_read > 0:
+            num_extra = num_records - rows_read
+            counts = chunk_rng(self.run_seed, chunk_index, SAMPLE_STREAM).multinomial(
+                num_extra, np.array(chunk_sizes) / rows_read
+            )
+            chunk_index += 1
+            seed_chunks = [first_chunk] if len(chunk_sizes) == 1 else reread_chunks()
+            for chunk, count in zip(seed_chunks, counts):
+                while count > 0:
+                    num_rows = min(count, batch_size)
+                    picks = chunk_rng(self.run_seed, chunk_index, SAMPLE_STREAM).integers(0, len(chunk), size=num_rows)
+                    yield chunk_index, chunk.take(picks), num_rows, False
+                    chunk_index += 1
+                    count -= num_rows
+            print(f"Extra rows generated: {num_extra}")
+
     def mask_csv(
-        self, input_file, output_file, columns_to_mask, num_records, ignore_lines="NO"
+        self,
+        input_file,
+        output_file,
+        columns_to_mask,
+        num_records,
+        ignore_lines="NO",
+        file_delimiter="|",
+        chunk_size=100000,
+        workers=1,
+        seed=None,
     ):
-        with open(input_file, "r") as f:
-            lines = f.readlines()
-
-        if ignore_lines == "NF":
-            first_line = lines[0]
-            lines = lines[1:]
-        elif ignore_lines == "NL":
-            last_line = lines[-1]
-            lines = lines[:-1]
-        elif ignore_lines == "NFL":
-            first_line = lines[0]
-            last_line = lines[-1]
-            lines = lines[1:-1]
-
-        with open("temp.csv", "w") as f:
-            f.writelines(lines)
-
-        df = pd.read_csv("temp.csv", sep=file_delimiter)
-
-        # Replace '?' with None
-        df.replace('?', None, inplace=True)
-
-        if num_records > len(df):
-            extra_rows = num_records - len(df)
-            df = pd.concat([df] + [df.sample(n=1, replace=True) for _ in range(extra_rows)])
-
-        if num_records > 0:
-            df_to_mask = df.head(num_records)
-            df_to_keep = df.tail(len(df) - num_records)
-        else:
-            df_to_mask = df if num_records == -1 else pd.DataFrame(columns=df.columns)
-            df_to_keep = df if num_records == 0 else pd.DataFrame(columns=df.columns)
+        """Mask the first num_records rows of input_file into output_file a chunk of rows at a time."""
+        # ignore_lines NF, NL and NFL copy the first and/or last line through unchanged.
+        # Each chunk draws from a generator seeded with [seed, chunk index], so the
+        # same input, seed and chunk_size give the same output for any number of workers
+        if seed is None:
+            seed = self.seed if self.seed is not None else np.random.SeedSequence().entropy
+            print(f"Masking seed: {seed}")
+        self.run_seed = seed
 
-        for column_name, (data_type, length, extra_params) in columns_to_mask.items():
-            if column_name != "FULL_NAME" and column_name in df_to_mask.columns:
-                print(f"Masking data in column: {column_name}")
-                df_to_mask.loc[:, column_name] = df_to_mask[column_name].apply(
-                    lambda x: self.mask_account_number(
-                        column_name, x, data_type, length, extra_params
-                    )
+        with open(input_file, "rb") as f, open(output_file, "w", newline="") as out:
+            first_line, start, end, last_line = data_byte_range(
+                f, skip_first=ignore_lines in ("NF", "NFL"), skip_last=ignore_lines in ("NL", "NFL")
+            )
+            if first_line is not None:
+                out.write(first_line)
+
+            print(f"Masking data in columns: {', '.join(columns_to_mask)}")
+            chunks = read_chunks(f, start, end, file_delimiter, chunk_size)
+            first_chunk = next(chunks, None)
+            if first_chunk is not None:
+                worker_args = (self, columns_to_mask, first_chunk.columns, file_delimiter)
+                tasks = self.mask_tasks(
+                    itertools.chain([first_chunk], chunks),
+                    lambda: read_chunks(f, start, end, file_delimiter, chunk_size),
+                    num_records,
+                    chunk_size,
                 )
+                rows_written = 0
+                if workers > 1:
+                    with ProcessPoolExecutor(
+                        workers, initializer=init_mask_worker, initargs=worker_args
+                    ) as executor:
+                        for num_rows, text in ordered_results(
+                            executor, mask_chunk_task, ((task,) for task in tasks), 2 * workers
+                        ):
+                            out.write(text)
+                            rows_written += num_rows
+                            print(f"Rows written: {rows_written}")
+                else:
+                    init_mask_worker(*worker_args)
+                    for num_rows, text in map(mask_chunk_task, tasks):
+                        out.write(text)
+                        rows_written += num_rows
+                        print(f"Rows written: {rows_written}")
+
+            if last_line is not None:
+                out.write(last_line)
+
+
+# chunk_rng stream for picking the rows of sampled batches, kept apart from
+# the masking draws that mask_chunk_task makes for the same chunk index
+SAMPLE_STREAM = 1
+
+
+def chunk_rng(run_seed, chunk_index, stream=None):
+    """Generator for one chunk, independent of which process masks it."""
+    if stream is None:
+        return np.random.default_rng(np.random.SeedSequence([run_seed, chunk_index]))
+    return np.random.default_rng(np.random.SeedSequence([run_seed, chunk_index, stream]))
+
+
+# Set in each masking process by init_mask_worker
+worker_masker = None
+worker_plan = None
+worker_delimiter = None
 
-        if "FULL_NAME" in df_to_mask.columns:
-            df_to_mask["FULL_NAME"] = (
-                df_to_mask["FIRST_NAME"] + " " + df_to_mask["LAST_NAME"]
-            )
 
-        df = pd.concat([df_to_mask, df_to_keep])
-        df.to_csv("temp.csv", index=False, sep=file_delimiter)
+def init_mask_worker(masker, columns_to_mask, columns, file_delimiter):
+    """Compile the masking plan once per process."""
+    global worker_masker, worker_plan, worker_delimiter
+    worker_masker = masker
+    worker_plan = masker.compile_mask_plan(columns_to_mask, columns)
+    worker_delimiter = file_delimiter
 
-        with open("temp.csv", "r") as f:
-            lines = f.readlines()
 
-        if ignore_lines == "NF":
-            lines.insert(0, first_line)
-        elif ignore_lines == "NL":
-            lines.append(last_line)
-        elif ignore_lines == "NFL":
-            lines.insert(0, first_line)
-            lines.append(last_line)
+def mask_chunk_task(task):
+    """Mask the first rows of one chunk and return (number of rows, CSV text)."""
+    chunk_index, chunk, num_to_mask, write_header = task
+    rng = chunk_rng(worker_masker.run_seed, chunk_index)
+    # Maskers without a column version use the random module
+    random.seed(int(rng.integers(2**63)))
 
-        with open(output_file, "w") as f:
-            f.writelines(lines)
+    chunk = chunk.copy()
+    # Replace '?' with None
+    chunk.replace("?", None, inplace=True)
+    if num_to_mask:
+        chunk = pd.concat(
+            [
+                worker_masker.mask_chunk(chunk.iloc[:num_to_mask].copy(), worker_plan, rng),
+                chunk.iloc[num_to_mask:],
+            ]
+        )
+    return len(chunk), chunk.to_csv(header=write_header, index=False, sep=worker_delimiter)
+
+
+class BoundedReader(io.RawIOBase):
+    """Read-only view of the bytes [start, end) of a binary file."""
+
+    def __init__(self, f, start, end):
+        f.seek(start)
+        self.f = f
+        self.remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self.remaining)
+        if size <= 0:
+            return 0
+        num_read = self.f.readinto(memoryview(buffer)[:size])
+        self.remaining -= num_read
+        return num_read
+
+
+def data_byte_range(f, skip_first=False, skip_last=False, block_size=64 * 1024):
+    """Split a binary file into (first line, data start, data end, last line), the lines only when skipped."""
+    # The last line is found by scanning back from the end, so the data is never read here
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    f.seek(0)
+    first_line = last_line = None
+    start, end = 0, size
+
+    if skip_first:
+        first_line = f.readline()
+        start = len(first_line)
+        first_line = first_line.decode()
+
+    if skip_last and size > start:
+        # A newline ending the file belongs to the last line
+        f.seek(size - 1)
+        pos = size - 1 if f.read(1) == b"\n" else size
+        end = start
+        while pos > start:
+            block_start = max(start, pos - block_size)
+            f.seek(block_start)
+            newline = f.read(pos - block_start).rfind(b"\n")
+            if newline >= 0:
+                end = block_start + newline + 1
+                break
+            pos = block_start
+        f.seek(end)
+        last_line = f.read(size - end).decode()
+
+    return first_line, start, end, last_line
+
+
+def read_chunks(f, start, end, file_delimiter, chunk_size):
+    """Parse the bytes [start, end) of f as CSV, chunk_size rows of text columns at a time."""
+    reader = io.BufferedReader(BoundedReader(f, start, end), buffer_size=1024 * 1024)
+    return pd.read_csv(reader, sep=file_delimiter, dtype=str, chunksize=chunk_size)
 
-        os.remove("temp.csv")
 
 if __name__ == "__main__":
     num_records = int(sys.argv[2])
     input_file = sys.argv[3]
     output_file = sys.argv[4]
     file_delimiter = "|"
+    workers = 1
+    seed = None
+    token_key = None
+    for arg in sys.argv[5:]:
+        if arg.startswith("workers="):
+            _, value = arg.split("=")
+            workers = int(value)
+        elif arg.startswith("seed="):
+            _, value = arg.split("=")
+            seed = int(value)
+        elif arg.startswith("tokenize="):
+            _, value = arg.split("=")
+            if value.lower() == "y":
+                # The key comes from the environment so it stays out of the command line
+                token_key = os.environ["MASK_TOKEN_KEY"]
+
+    tokenizer = None
+    if token_key is not None:
+        tokenizer = Tokenizer(token_key)
 
-    data_masker = DataMasker()
+    data_masker = DataMasker(tokenizer=tokenizer)
     data_masker.mask_csv(
-        input_file, output_file, columns_to_mask, num_records, ignore_lines=sys.argv[1]
+        input_file,
+        output_file,
+        columns_to_mask,
+        num_records,
+        ignore_lines=sys.argv[1],
+        file_delimiter=file_delimiter,
+        workers=workers,
+        seed=seed,
     )
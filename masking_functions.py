@@ -1,5 +1,11 @@
 import random
 import string
+import hashlib
+import hmac
+import json
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
 from config import first_names, last_names, org_structure, org_names
 
 
@@ -55,6 +61,223 @@ def mask_default(account_number, length, extra_params):
         return "".join(random.choices(string.ascii_uppercase + string.digits, k=length))
 
 
+# Column versions of the maskers above: each one masks a whole column (an
+# object array) at once with a numpy Generator instead of one call per value
+
+ALPHANUMERIC = np.frombuffer((string.ascii_uppercase + string.digits).encode(), dtype="S1")
+DIGITS = np.frombuffer(string.digits.encode(), dtype="S1")
+
+
+def random_strings(rng, alphabet, num_values, length):
+    """num_values random strings of length characters drawn from alphabet."""
+    chars = alphabet[rng.integers(0, len(alphabet), size=(num_values, length))]
+    return np.ascontiguousarray(chars).view(f"S{length}").ravel().astype(str).astype(object)
+
+
+def mask_only_allowed_values_column(values, length, extra_params, rng):
+    allowed_values = np.array(extra_params.get("allowed_values"), dtype=object)
+    return allowed_values[rng.integers(0, len(allowed_values), size=len(values))]
+
+
+def mask_add_values_column(values, length, extra_params, rng):
+    # Null or blank values stay blank, everything else is shifted by 1000;
+    # a non-numeric value raises ValueError, as float() does in mask_add_values
+    values = pd.Series(values, dtype=object)
+    present = (values.notna() & (values.astype(str).str.strip() != "")).to_numpy()
+    numbers = pd.to_numeric(values[present])
+    masked = np.full(len(values), "", dtype=object)
+    masked[present] = (numbers.astype(float).astype(np.int64) + 1000).astype(str).to_numpy()
+    return masked
+
+
+def mask_first_name_column(values, length, extra_params, rng):
+    return np.array(first_names, dtype=object)[rng.integers(0, len(first_names), size=len(values))]
+
+
+def mask_last_name_column(values, length, extra_params, rng):
+    return np.array(last_names, dtype=object)[rng.integers(0, len(last_names), size=len(values))]
+
+
+def mask_any_name_column(values, length, extra_params, rng):
+    separator = extra_params.get("separator", " ")
+    return (
+        mask_first_name_column(values, length, extra_params, rng)
+        + separator
+        + mask_last_name_column(values, length, extra_params, rng)
+    )
+
+
+def mask_org_name_column(values, length, extra_params, rng):
+    separator = extra_params.get("separator", " ")
+    first_name = np.array(org_names, dtype=object)[rng.integers(0, len(org_names), size=len(values))]
+    last_name = np.array(org_structure, dtype=object)[rng.integers(0, len(org_structure), size=len(values))]
+    return first_name + separator + last_name
+
+
+def mask_acct_column(values, length, extra_params, rng):
+    # Only values of exactly length characters are replaced
+    masked = np.array(values, dtype=object)
+    replace = np.array([len(value) == length for value in masked.astype(str)], dtype=bool)
+    masked[replace] = random_strings(rng, ALPHANUMERIC, int(replace.sum()), length)
+    return masked
+
+
+def mask_integer_column(values, length, extra_params, rng):
+    return random_strings(rng, DIGITS, len(values), length)
+
+
+def mask_default_column(values, length, extra_params, rng):
+    return random_strings(rng, ALPHANUMERIC, len(values), length)
+
+
+# Column version of each masker, used when a whole column is masked at once
+column_mask_functions = {
+    mask_only_allowed_values: mask_only_allowed_values_column,
+    mask_add_values: mask_add_values_column,
+    mask_first_name: mask_first_name_column,
+    mask_last_name: mask_last_name_column,
+    mask_any_name: mask_any_name_column,
+    mask_org_name: mask_org_name_column,
+    mask_acct: mask_acct_column,
+    mask_integer: mask_integer_column,
+    mask_default: mask_default_column,
+}
+
+
+# Token versions of the maskers: the same value always gets the same token.
+# Each one picks its output from digest, a keyed hash of the value, instead of
+# drawing random numbers.
+
+def digest_index(digest, num_choices, offset=0):
+    """Index into num_choices items from 8 bytes of a digest."""
+    return int.from_bytes(digest[offset:offset + 8], "big") % num_choices
+
+
+def preserve_format(value, digest):
+    """Replace every digit and letter of value by one of the same kind."""
+    if len(value) > len(digest):
+        digest = hashlib.shake_256(digest).digest(len(value))
+    chars = []
+    for char, byte in zip(value, digest):
+        if char.isdigit():
+            chars.append(string.digits[byte % 10])
+        elif char.isupper():
+            chars.append(string.ascii_uppercase[byte % 26])
+        elif char.islower():
+            chars.append(string.ascii_lowercase[byte % 26])
+        else:
+            chars.append(char)
+    return "".join(chars)
+
+
+def token_only_allowed_values(account_number, length, extra_params, digest):
+    allowed_values = extra_params.get("allowed_values")
+    return allowed_values[digest_index(digest, len(allowed_values))]
+
+
+def token_first_name(account_number, length, extra_params, digest):
+    return first_names[digest_index(digest, len(first_names))]
+
+
+def token_last_name(account_number, length, extra_params, digest):
+    return last_names[digest_index(digest, len(last_names))]
+
+
+def token_any_name(account_number, length, extra_params, digest):
+    separator = extra_params.get("separator", " ")
+    first_name = first_names[digest_index(digest, len(first_names))]
+    last_name = last_names[digest_index(digest, len(last_names), 8)]
+    return f"{first_name}{separator}{last_name}"
+
+
+def token_org_name(account_number, length, extra_params, digest):
+    separator = extra_params.get("separator", " ")
+    first_name = org_names[digest_index(digest, len(org_names))]
+    last_name = org_structure[digest_index(digest, len(org_structure), 8)]
+    return f"{first_name}{separator}{last_name}"
+
+
+def token_acct(account_number, length, extra_params, digest):
+    if len(account_number) == length:
+        return preserve_format(account_number, digest)
+    else:
+        return account_number
+
+
+def token_integer(account_number, length, extra_params, digest):
+    return preserve_format("0" * length, digest)
+
+
+def token_default(account_number, length, extra_params, digest):
+    if len(digest) < length:
+        digest = hashlib.shake_256(digest).digest(length)
+    alphabet = string.ascii_uppercase + string.digits
+    return "".join(alphabet[byte % len(alphabet)] for byte in digest[:length])
+
+
+# Token version of each masker, used when DataMasker is given a Tokenizer
+token_mask_functions = {
+    mask_only_allowed_values: token_only_allowed_values,
+    mask_first_name: token_first_name,
+    mask_last_name: token_last_name,
+    mask_any_name: token_any_name,
+    mask_org_name: token_org_name,
+    mask_acct: token_acct,
+    mask_integer: token_integer,
+    mask_default: token_default,
+}
+
+
+class Tokenizer:
+    """Keyed, deterministic tokens for column values, from HMAC-SHA512(key, domain + value)."""
+    # The domain defaults to the masker's name (extra_params["token_domain"] sets it),
+    # so e.g. every mask_acct column agrees with the others. A token is a pure
+    # function of the key and the value, so recent ones are only kept in an LRU.
+
+    def __init__(self, key, cache_size=100000):
+        self.key = key.encode() if isinstance(key, str) else key
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+    def __getstate__(self):
+        # Worker processes start with an empty cache
+        state = self.__dict__.copy()
+        state["cache"] = OrderedDict()
+        return state
+
+    def digest(self, domain, value):
+        return hmac.new(self.key, f"{domain}\x1f{value}".encode(), hashlib.sha512).digest()
+
+    def tokens(self, token_function, values, length, extra_params):
+        """Tokens for a list of distinct non-null values, as strings."""
+        domain = extra_params.get("token_domain", token_function.__name__)
+        # Tokens also depend on the length and the other extra params
+        cache_domain = f"{domain}|{length}|{json.dumps(extra_params, sort_keys=True, default=str)}"
+
+        tokens = {}
+        for value in values:
+            token = self.cache.get((cache_domain, value))
+            if token is None:
+                token = token_function(value, length, extra_params, self.digest(domain, value))
+                self.cache[(cache_domain, value)] = token
+            else:
+                self.cache.move_to_end((cache_domain, value))
+            tokens[value] = token
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return tokens
+
+    def mask_column(self, token_function, values, length, extra_params):
+        """Tokenize a whole column; nulls stay null."""
+        values = pd.Series(values, dtype=object)
+        present = values.notna()
+        distinct = pd.unique(values[present].astype(str))
+        tokens = self.tokens(token_function, list(distinct), length, extra_params)
+        masked = np.full(len(values), None, dtype=object)
+        masked[present.to_numpy()] = values[present].astype(str).map(tokens).to_numpy()
+        return masked
+
+
 # Defining columns to be treated special 
 mask_functions = {
     "ID2": mask_add_values,
@@ -0,0 +1,160 @@
+import collections
+import concurrent.futures
+import csv
+import io
+import mmap
+import os
+import numpy as np
+import pandas as pd
+
+
+def count_quotes(mm, start, end, block_size=16 * 1024 * 1024):
+    """Count the quote characters in mm[start:end] one block at a time."""
+    count = 0
+    for block_start in range(start, end, block_size):
+        count += mm[block_start:min(block_start + block_size, end)].count(b'"')
+    return count
+
+
+def next_record_end(mm, pos, in_quotes=False):
+    """Offset just past the first newline from pos that is outside a quoted field."""
+    size = len(mm)
+    while pos < size:
+        newline = mm.find(b"\n", pos)
+        if newline == -1:
+            return size
+        if count_quotes(mm, pos, newline) % 2:
+            in_quotes = not in_quotes
+        if not in_quotes:
+            return newline + 1
+        pos = newline + 1
+    return size
+
+
+def split_byte_ranges(mm, start, num_ranges):
+    """Split mm[start:] into about num_ranges byte ranges ending on record boundaries."""
+    # Quote parity is tracked from the start of each range (RFC 4180 quoting)
+    size = len(mm)
+    step = max((size - start) // num_ranges, 1)
+    byte_ranges = []
+    range_start = start
+    while range_start < size:
+        candidate = range_start + step
+        if candidate >= size:
+            range_end = size
+        else:
+            in_quotes = count_quotes(mm, range_start, candidate) % 2 == 1
+            range_end = next_record_end(mm, candidate, in_quotes)
+        byte_ranges.append((range_start, range_end))
+        range_start = range_end
+    return byte_ranges
+
+
+def parse_byte_range(file_path, start, end, header, delimiter, keep_default_na=True):
+    """Parse one byte range of file_path into column arrays (runs in a worker process)."""
+    with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        data = mm[start:end]
+    try:
+        chunk = pd.read_csv(
+            io.BytesIO(data),
+            header=None,
+            names=header,
+            dtype=str,
+            delimiter=delimiter,
+            keep_default_na=keep_default_na,
+        )
+    except pd.errors.EmptyDataError:
+        return [np.array([], dtype=object) for _ in header]
+    return [chunk.iloc[:, i].to_numpy(dtype=object) for i in range(len(header))]
+
+
+def ordered_results(executor, function, tasks, window):
+    """Like executor.map over argument tuples, with at most window tasks in flight."""
+    pending = collections.deque()
+    for task in tasks:
+        pending.append(executor.submit(function, *task))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def read_file_parallel(
+    file_path,
+    delimiter,
+    column_mapping=None,
+    workers=None,
+    range_size=64 * 1024 * 1024,
+    keep_default_na=True,
+):
+    """Yield (header, columns) batches, in file order, parsed from byte ranges in a process pool."""
+    _, file_extension = os.path.splitext(file_path)
+    if file_extension not in (".csv", ".dat"):
+        raise ValueError("Unsupported file format")
+    if os.path.getsize(file_path) == 0:
+        return
+
+    workers = workers or os.cpu_count()
+
+    with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        header_end = next_record_end(mm, 0)
+        header = list(
+            pd.read_csv(io.BytesIO(mm[:header_end]), dtype=str, delimiter=delimiter, nrows=0).columns
+        )
+        num_ranges = max(workers, -(-(len(mm) - header_end) // range_size))
+        byte_ranges = split_byte_ranges(mm, header_end, num_ranges)
+
+    if not byte_ranges:
+        return
+
+    renamed_header = [column_mapping.get(col, col) for col in header] if column_mapping else header
+    tasks = (
+        (file_path, start, end, header, delimiter, keep_default_na) for start, end in byte_ranges
+    )
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        for columns in ordered_results(executor, parse_byte_range, tasks, 2 * workers):
+            # Nulls come back from the workers as fresh float objects; use the
+            # shared np.nan like pandas does in the single-process path
+            for column in columns:
+                column[pd.isnull(column)] = np.nan
+            yield renamed_header, columns
+
+
+def read_rows_parallel(file_path, delimiter, column_mapping=None, workers=None):
+    """(header, list of row dicts) for a .csv/.dat file, as csv.DictReader would return them."""
+    if not workers or workers < 2:
+        # No pool unless asked for, so unguarded scripts keep working under spawn
+        with open(file_path, "r", newline="") as f:
+            reader = csv.DictReader(f, delimiter=delimiter)
+            header = reader.fieldnames or []
+            if column_mapping:
+                header = reader.fieldnames = [column_mapping.get(col, col) for col in header]
+            return header, list(reader)
+
+    # Byte ranges are parsed over a process pool; keep_default_na=False keeps
+    # blank fields as '' so the rows match the csv.DictReader path above
+    header = None
+    rows = []
+    for header, columns in read_file_parallel(
+        file_path, delimiter, column_mapping, workers, keep_default_na=False
+    ):
+        rows.extend(dict(zip(header, values)) for values in zip(*columns))
+    if header is None:
+        with open(file_path, "r", newline="") as f:
+            header = next(csv.reader(f, delimiter=delimiter), [])
+    return header, rows
+
+
+def read_frame_parallel(file_path, delimiter, column_mapping=None, workers=None):
+    """A .csv/.dat file as a DataFrame of strings, parsed over a process pool if workers > 1."""
+    header = None
+    parts = []
+    if workers and workers > 1:
+        for header, columns in read_file_parallel(file_path, delimiter, column_mapping, workers):
+            parts.append(columns)
+    if header is None:
+        df = pd.read_csv(file_path, dtype=str, sep=delimiter)
+        return df.rename(columns=column_mapping) if column_mapping else df
+    return pd.DataFrame(
+        {col: np.concatenate([columns[i] for columns in parts]) for i, col in enumerate(header)}
+    )
@@ -0,0 +1,39 @@
+import pandas as pd
+
+
+def key_match_flags(rows1, rows2, key_columns):
+    """Flag each row of both files by whether its key_columns tuple also occurs in the other file."""
+    # Hash anti-join: one pass to index each file, one pass to look up each row's key
+    row_keys1 = [tuple(row[col] for col in key_columns) for row in rows1]
+    row_keys2 = [tuple(row[col] for col in key_columns) for row in rows2]
+    key_index1 = set(row_keys1)
+    key_index2 = set(row_keys2)
+    return [key in key_index2 for key in row_keys1], [key in key_index1 for key in row_keys2]
+
+
+def split_on_flags(rows, matched):
+    """(kept rows, extra rows) of rows split on their match flags, in order and duplicates included."""
+    kept = []
+    extra = []
+    for row, row_matched in zip(rows, matched):
+        (kept if row_matched else extra).append(row)
+    return kept, extra
+
+
+def composite_key_hashes(df1, df2, col_check_list):
+    """Hash the col_check columns of both frames into one uint64 key per row."""
+    keys1 = df1[col_check_list]
+    keys2 = df2[col_check_list]
+    for col in col_check_list:
+        # An int column on one side and a float column on the other must still match
+        if (
+            keys1[col].dtype != keys2[col].dtype
+            and pd.api.types.is_numeric_dtype(keys1[col])
+            and pd.api.types.is_numeric_dtype(keys2[col])
+        ):
+            keys1 = keys1.astype({col: "float64"})
+            keys2 = keys2.astype({col: "float64"})
+    return (
+        pd.util.hash_pandas_object(keys1, index=False),
+        pd.util.hash_pandas_object(keys2, index=False),
+    )
@@ -1,3 +1,6 @@
+from recon_keys import composite_key_hashes
+
+
 def perform_recon_on_files(file1, file2, col_check=None, column_mapping=None):
     print(col_check)
     delimiter1 = ","
@@ -13,13 +16,14 @@ def perform_recon_on_files(file1, file2, col_check=None, column_mapping=None):
         if column_mapping is not None:
             col_check_list = [column_mapping.get(col, col) for col in col_check_list]
 
-        # Create sets for faster lookup
-        set1 = set(tuple(row) for row in df1[col_check_list].values)
-        set2 = set(tuple(row) for row in df2[col_check_list].values)
+        # Hash the key columns once; the extra and kept masks all come from it
+        key_hashes1, key_hashes2 = composite_key_hashes(df1, df2, col_check_list)
+        in_file2 = key_hashes1.isin(key_hashes2)
+        in_file1 = key_hashes2.isin(key_hashes1)
 
         # Find extra records
-        extra_records1 = df1[~df1[col_check_list].apply(tuple, axis=1).isin(set2)]
-        extra_records2 = df2[~df2[col_check_list].apply(tuple, axis=1).isin(set1)]
+        extra_records1 = df1[~in_file2]
+        extra_records2 = df2[~in_file1]
 
         # Write the results to output.csv
         with open("output.csv", "w", newline="") as output_file:
@@ -50,7 +54,7 @@ def perform_recon_on_files(file1, file2, col_check=None, column_mapping=None):
                 writer.writerow([])
 
         # Update the temporary files
-        df1 = df1[df1[col_check_list].apply(tuple, axis=1).isin(set2)]
-        df2 = df2[df2[col_check_list].apply(tuple, axis=1).isin(set1)]
+        df1 = df1[in_file2]
+        df2 = df2[in_file1]
         df1.to_csv(file1, index=False, sep=delimiter1)
         df2.to_csv(file2, index=False, sep=delimiter2)
@@ -1,18 +1,12 @@
-import concurrent.futures
+from parallel_csv import read_rows_parallel
+from recon_keys import key_match_flags, split_on_flags
 
-def perform_recon_on_files(file1, file2, col_check=None, column_mapping=None):
+def perform_recon_on_files(file1, file2, col_check=None, column_mapping=None, parse_workers=None):
     print(col_check)
     if col_check is not None:
         # Read the CSV files
-        extra_records1 = []
-        extra_records2 = []
-
-        # Read the CSV files
-        with open(file1, "r") as f1, open(file2, "r") as f2:
-            csv_reader1 = csv.DictReader(f1, delimiter=delimiter)
-            csv_reader2 = csv.DictReader(f2, delimiter=delimiter)
-            rows1 = list(csv_reader1)
-            rows2 = list(csv_reader2)
+        fieldnames1, rows1 = read_rows_parallel(file1, delimiter, workers=parse_workers)
+        fieldnames2, rows2 = read_rows_parallel(file2, delimiter, workers=parse_workers)
 
         col_check_list = col_check.split(",")
 
@@ -23,51 +17,17 @@ def perform_recon_on_files(file1, file2, col_check=None, column_mapping=None):
                 col_check_list_mapped.append(mapped_col)
             col_check_list = col_check_list_mapped
 
-        def find_extra_records_file1(row1):
-            found = False
-            for row2 in rows2:
-                match = True
-                for col in col_check_list:
-                    if row1[col] != row2[col]:
-                        match = False
-                        break
-                if match:
-                    found = True
-                    break
-            if not found:
-                return row1
-
-        def find_extra_records_file2(row2):
-            found = False
-            for row1 in rows1:
-                match = True
-                for col in col_check_list:
-                    if row2[col] != row1[col]:
-                        match = False
-                        break
-                if match:
-                    found = True
-                    break
-            if not found:
-                return row2
-
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            extra_records1 = list(executor.map(find_extra_records_file1, rows1))
-
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            extra_records2 = list(executor.map(find_extra_records_file2, rows2))
-
-        extra_records1 = [record for record in extra_records1 if record is not None]
-        extra_records2 = [record for record in extra_records2 if record is not None]
-
-        # Delete the extra records from the temporary files
+        # Split off the records whose col_check key the other file lacks;
+        # the kept rows go to the temporary files, duplicates included
+        matched1, matched2 = key_match_flags(rows1, rows2, col_check_list)
+        rows1, extra_records1 = split_on_flags(rows1, matched1)
+        rows2, extra_records2 = split_on_flags(rows2, matched2)
+
         for row in extra_records1:
             print(row)
-            rows1.remove(row)
 
         for row in extra_records2:
             print(row)
-            rows2.remove(row)
 
         # Write the results to output.csv
         with open("output.csv", "w", newline="") as output_file:
@@ -83,7 +43,7 @@ def perform_recon_on_files(file1, file2, col_check=None, column_mapping=None):
             )
             writer.writerow([])
             if extra_records1:
-                writer.writerow(csv_reader1.fieldnames)
+                writer.writerow(fieldnames1)
                 for row in extra_records1:
                     writer.writerow(
                         [
@@ -107,7 +67,7 @@ def perform_recon_on_files(file1, file2, col_check=None, column_mapping=None):
             )
             writer.writerow([])
             if extra_records2:
-                writer.writerow(csv_reader2.fieldnames)
+                writer.writerow(fieldnames2)
                 for row in extra_records2:
                     writer.writerow(
                         [
@@ -121,10 +81,10 @@ def perform_recon_on_files(file1, file2, col_check=None, column_mapping=None):
         # Save the updated temporary files
         with open(file1, "w", newline="") as f1, open(file2, "w", newline="") as f2:
             writer1 = csv.DictWriter(
-                f1, fieldnames=csv_reader1.fieldnames, delimiter=delimiter
+                f1, fieldnames=fieldnames1, delimiter=delimiter
             )
             writer2 = csv.DictWriter(
-                f2, fieldnames=csv_reader2.fieldnames, delimiter=delimiter
+                f2, fieldnames=fieldnames2, delimiter=delimiter
             )
             writer1.writeheader()
             writer2.writeheader()
@@ -158,21 +118,6 @@ def read_mapping(file):
                 mapping[source_cols[i]] = target_cols[i]
     return mapping
 
-def update_column_names(file, column_mapping):
-    with open(file, "r") as f:
-        reader = csv.DictReader(f, delimiter=delimiter)
-        rows = list(reader)
-        new_fieldnames = [column_mapping.get(name, name) for name in reader.fieldnames]
-
-    with open(file, "w", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=new_fieldnames, delimiter=delimiter)
-        writer.writeheader()
-        for row in rows:
-            new_row = {
-                column_mapping.get(name, name): value for name, value in row.items()
-            }
-            writer.writerow(new_row)
-
 def create_temp_files(file1, file2, column_mapping=None, buffer_size=1024 * 1024):
     global delimiter
     delimiter = fetch_delimiter(file1)
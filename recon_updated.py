@@ -1,8 +1,10 @@
 import csv
-import shutil
 import sys
 import os
 import pandas as pd
+from staging import stage_temp_files, update_column_names
+from parallel_csv import read_rows_parallel
+from recon_keys import key_match_flags, split_on_flags
 
 def fetch_delimiter(file_path):
     _, file_extension = os.path.splitext(file_path)
@@ -22,45 +24,27 @@ def read_mapping(file):
                 mapping[source_cols[i]] = target_cols[i]
     return mapping
 
-def update_column_names(file, column_mapping):
-    with open(file, 'r') as f:
-        reader = csv.DictReader(f, delimiter=delimiter)
-        rows = list(reader)
-        new_fieldnames = [column_mapping.get(name, name) for name in reader.fieldnames]
-
-    with open(file, 'w', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=new_fieldnames, delimiter=delimiter)
-        writer.writeheader()
-        for row in rows:
-            new_row = {column_mapping.get(name, name): value for name, value in row.items()}
-            writer.writerow(new_row)
-
-def create_temp_files(file1, file2, column_mapping=None):
+def create_temp_files(file1, file2, column_mapping=None, buffer_size=1024 * 1024, mutable=True):
     global delimiter
     delimiter = fetch_delimiter(file1)
     print(delimiter)
-    shutil.copy(file1, 'a_tmp.csv')
-    shutil.copy(file2, 'b_tmp.csv')
+
+    staged, copied, avoided = stage_temp_files(file1, file2, buffer_size, mutable or column_mapping is not None)
+    print(f"Staging: {copied} bytes copied, {avoided} bytes avoided")
 
     if column_mapping is not None:
         column_mapping = read_mapping('mapping.txt')
         print(column_mapping)
-        update_column_names('a_tmp.csv', column_mapping)
-        update_column_names('b_tmp.csv', column_mapping)
+        update_column_names(staged[0], column_mapping, delimiter)
+        update_column_names(staged[1], column_mapping, delimiter)
+    return staged
 
-def perform_recon_on_files(file1, file2, col_check=None, column_mapping=None):
+def perform_recon_on_files(file1, file2, col_check=None, column_mapping=None, parse_workers=None):
     print(col_check)
     if col_check is not None:
         # Read the CSV files
-        with open(file1, 'r') as f1, open(file2, 'r') as f2:
-            csv_reader1 = csv.DictReader(f1, delimiter=delimiter)
-            csv_reader2 = csv.DictReader(f2, delimiter=delimiter)
-            rows1 = list(csv_reader1)
-            rows2 = list(csv_reader2)
-
-        # Compare the records based on the specified columns
-        extra_records1 = []
-        extra_records2 = []
+        fieldnames1, rows1 = read_rows_parallel(file1, delimiter, workers=parse_workers)
+        fieldnames2, rows2 = read_rows_parallel(file2, delimiter, workers=parse_workers)
 
         col_check_list = col_check.split(',')
 
@@ -71,33 +55,11 @@ def perform_recon_on_files(file1, file2, col_check=None, column_mapping=None):
                 col_check_list_mapped.append(mapped_col)
             col_check_list = col_check_list_mapped
 
-        for row1 in rows1:
-            found = False
-            for row2 in rows2:
-                match = True
-                for col in col_check_list:
-                    if row1[col] != row2[col]:
-                        match = False
-                        break
-                if match:
-                    found = True
-                    break
-            if not found:
-                extra_records1.append(row1)
-
-        for row2 in rows2:
-            found = False
-            for row1 in rows1:
-                match = True
-                for col in col_check_list:
-                    if row2[col] != row1[col]:
-                        match = False
-                        break
-                if match:
-                    found = True
-                    break
-            if not found:
-                extra_records2.append(row2)
+        # Split off the records whose col_check key the other file lacks;
+        # the kept rows go to the temporary files, duplicates included
+        matched1, matched2 = key_match_flags(rows1, rows2, col_check_list)
+        rows1, extra_records1 = split_on_flags(rows1, matched1)
+        rows2, extra_records2 = split_on_flags(rows2, matched2)
 
         # Write the results to output.csv
         with open('output.csv', 'w', newline='') as output_file:
@@ -108,7 +70,7 @@ def perform_recon_on_files(file1, file2, col_check=None, column_mapping=None):
             ])
             writer.writerow([])
             if extra_records1:
-                writer.writerow(csv_reader1.fieldnames)
+                writer.writerow(fieldnames1)
                 for row in extra_records1:
                     writer.writerow([str(val).replace("", "") if val is not None else '' for val in row.values()])
             else:
@@ -122,69 +84,70 @@ def perform_recon_on_files(file1, file2, col_check=None, column_mapping=None):
             ])
             writer.writerow([])
             if extra_records2:
-                writer.writerow(csv_reader2.fieldnames)
+                writer.writerow(fieldnames2)
                 for row in extra_records2:
                     writer.writerow([str(val).replace("", "") if val is not None else '' for val in row.values()])
             else:
                 writer.writerow([])
 
-        # Delete the extra records from the temporary files
-        for row in extra_records1:
-            rows1.remove(row)
-
-        for row in extra_records2:
-            rows2.remove(row)
-
         # Save the updated temporary files
         with open('a_tmp.csv', 'w', newline='') as f1, open('b_tmp.csv', 'w', newline='') as f2:
-            writer1 = csv.DictWriter(f1, fieldnames=csv_reader1.fieldnames, delimiter=delimiter)
-            writer2 = csv.DictWriter(f2, fieldnames=csv_reader2.fieldnames, delimiter=delimiter)
+            writer1 = csv.DictWriter(f1, fieldnames=fieldnames1, delimiter=delimiter)
+            writer2 = csv.DictWriter(f2, fieldnames=fieldnames2, delimiter=delimiter)
             writer1.writeheader()
             writer2.writeheader()
             writer1.writerows(rows1)
             writer2.writerows(rows2)
 
-def compare_csv(file1, file2, col_check=None, column_mapping=None):
-    create_temp_files(file1, file2, column_mapping)
-    perform_recon_on_files('a_tmp.csv', 'b_tmp.csv', col_check=col_check, column_mapping=column_mapping)
+def compare_csv(file1, file2, col_check=None, column_mapping=None, read_only=False, parse_workers=None):
+    staged1, staged2 = create_temp_files(file1, file2, column_mapping, mutable=not read_only or col_check is not None)
+    perform_recon_on_files(staged1, staged2, col_check=col_check, column_mapping=column_mapping, parse_workers=parse_workers)
+    return staged1, staged2
 
 # Run the compare_csv function with the required parameters
-file1 = "a.dat"
-file2 = "b.dat"
-column_mapping = None
-col_check = None
-
-for arg in sys.argv:
-    if arg.startswith("col_check="):
-        _, value = arg.split("=")
-        if value.lower() != "none":
-            if value == "*":
-                with open(file2, 'r') as f:
-                    reader = csv.reader(f)
-                    col_check = next(reader)
-                    col_check = ','.join(col_check)
-                    print(col_check)
+# (guarded: the parse pool may re-import this module in its workers)
+if __name__ == "__main__":
+    file1 = "a.dat"
+    file2 = "b.dat"
+    column_mapping = None
+    col_check = None
+    parse_workers = None
+
+    for arg in sys.argv:
+        if arg.startswith("col_check="):
+            _, value = arg.split("=")
+            if value.lower() != "none":
+                if value == "*":
+                    with open(file2, 'r') as f:
+                        reader = csv.reader(f)
+                        col_check = next(reader)
+                        col_check = ','.join(col_check)
+                        print(col_check)
+                else:
+                    col_check = value
+        elif arg.startswith("column_mapping="):
+            _, value = arg.split("=")
+            if value.lower() == "y":
+                with open("mapping.txt", "r") as f:
+                    column_mapping = {}
+                    lines = f.readlines()
+                    for line in lines:
+                        mapping = line.strip().split(":")
+                        if len(mapping) == 2:
+                            src_cols = mapping[0].split(",")
+                            dest_cols = mapping[1].split(",")
+                            for src_col, dest_col in zip(src_cols, dest_cols):
+                                column_mapping[src_col] = dest_col
             else:
-                col_check = value
-    elif arg.startswith("column_mapping="):
-        _, value = arg.split("=")
-        if value.lower() == "y":
-            with open("mapping.txt", "r") as f:
-                column_mapping = {}
-                lines = f.readlines()
-                for line in lines:
-                    mapping = line.strip().split(":")
-                    if len(mapping) == 2:
-                        src_cols = mapping[0].split(",")
-                        dest_cols = mapping[1].split(",")
-                        for src_col, dest_col in zip(src_cols, dest_cols):
-                            column_mapping[src_col] = dest_col
-        else:
-            column_mapping = None
+                column_mapping = None
+        elif arg.startswith("parse_workers="):
+            _, value = arg.split("=")
+            parse_workers = int(value)
 
-compare_csv(file1, file2, col_check=col_check, column_mapping=column_mapping)
+    compare_csv(file1, file2, col_check=col_check, column_mapping=column_mapping, parse_workers=parse_workers)
 
 
+'''
 #Also below code to copy and rename
 
 import shutil
@@ -319,7 +282,4 @@ def create_temp_files(file1, file2, buffer_size=1024*1024, column_mapping=None):
 
 # Example usage
 create_temp_files('file1.csv', 'file2.csv', buffer_size=8*1024*1024)
-
-
-
-
+'''
@@ -0,0 +1,93 @@
+import csv
+import io
+import os
+try:
+    import fcntl
+except ImportError:  # Windows has no reflink ioctl
+    fcntl = None
+
+FICLONE = 0x40049409  # Linux ioctl that clones file extents copy-on-write
+
+
+def copy_file_body(src_fd, dst_fd, offset, buffer_size=1024 * 1024):
+    """Append src_fd from offset to its end onto dst_fd by copy_file_range, sendfile or read/write."""
+    remaining = os.fstat(src_fd).st_size - offset
+    while remaining > 0:
+        try:
+            copied = os.copy_file_range(src_fd, dst_fd, remaining, offset)
+        except (AttributeError, OSError):
+            try:
+                copied = os.sendfile(dst_fd, src_fd, offset, remaining)
+            except (AttributeError, OSError):
+                os.lseek(src_fd, offset, os.SEEK_SET)
+                copied = os.write(dst_fd, os.read(src_fd, min(remaining, buffer_size)))
+        if copied == 0:
+            break
+        offset += copied
+        remaining -= copied
+
+
+def renamed_header_line(header_line, column_mapping, delimiter=","):
+    """Re-encode a raw header line with the mapped column names, keeping its line ending."""
+    header_text = header_line.decode("utf-8")
+    fields = header_text.rstrip("\r\n")
+    fieldnames = next(csv.reader([fields], delimiter=delimiter))
+    new_fieldnames = [column_mapping.get(name, name) for name in fieldnames]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=delimiter, lineterminator=header_text[len(fields):])
+    writer.writerow(new_fieldnames)
+    return buffer.getvalue().encode("utf-8")
+
+
+def splice_renamed_header(src, dst, column_mapping, delimiter=","):
+    """Write dst as src with a renamed header line; the body bytes are copied untouched."""
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        header_line = fsrc.readline()
+        fdst.write(renamed_header_line(header_line, column_mapping, delimiter))
+        fdst.flush()
+        copy_file_body(fsrc.fileno(), fdst.fileno(), len(header_line))
+
+
+def update_column_names(file, column_mapping, delimiter=","):
+    """Rename the header columns of file in place without rewriting its body."""
+    with open(file, "rb") as f:
+        header_line = f.readline()
+    new_header_line = renamed_header_line(header_line, column_mapping, delimiter)
+
+    if len(new_header_line) == len(header_line):
+        # Same length: overwrite the header bytes in place
+        with open(file, "r+b") as f:
+            f.write(new_header_line)
+    else:
+        # Otherwise splice the new header in front of the untouched body
+        splice_renamed_header(file, file + ".hdr", column_mapping, delimiter)
+        os.replace(file + ".hdr", file)
+
+
+def stage_file(src, dst, buffer_size=1024 * 1024):
+    """Copy src to dst by reflink clone or in-kernel copy; returns (bytes copied, bytes avoided)."""
+    # No hardlinks: the staged files are rewritten in place afterwards
+    size = os.path.getsize(src)
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        if fcntl is not None:
+            try:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                return 0, size
+            except OSError:
+                pass  # No reflink support on this filesystem or across filesystems
+        copy_file_body(fsrc.fileno(), fdst.fileno(), 0, buffer_size)
+    return size, 0
+
+
+def stage_temp_files(file1, file2, buffer_size=1024 * 1024, mutable=True, temp_names=("a_tmp.csv", "b_tmp.csv")):
+    """Stage file1 and file2 under temp_names; returns ((path1, path2), bytes copied, bytes avoided)."""
+    if not mutable:
+        # Nothing rewrites the inputs later, so the originals are read in place
+        return (file1, file2), 0, os.path.getsize(file1) + os.path.getsize(file2)
+
+    copied = avoided = 0
+    for src, dst in zip((file1, file2), temp_names):
+        file_copied, file_avoided = stage_file(src, dst, buffer_size)
+        copied += file_copied
+        avoided += file_avoided
+    return tuple(temp_names), copied, avoided
@@ -0,0 +1,237 @@
+import datetime
+import random
+import shutil
+from operator import itemgetter
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+import final_comparison_performance_based
+from final_comparison_performance_based import (
+    compare_csv_files,
+    count_fingerprint_differences,
+    count_sorted_run_differences,
+    external_sort_rows,
+    files_equivalent,
+    keyed_rows,
+    merge_join_indices,
+    merge_join_rows,
+    merge_sorted_runs,
+    pair_key_group,
+    parallel_sort_rows,
+    partition_rows,
+    read_sorted_run,
+    row_fingerprints,
+    sample_sort_rows,
+)
+
+
+def external_differences(rows1, rows2, header, spill_dir, sort_keys=None):
+    # A zero budget spills every row to its own run, so the merge passes run too
+    run_paths1, _ = external_sort_rows(rows1, sort_keys, 0, str(spill_dir), header=header)
+    run_paths2, _ = external_sort_rows(rows2, sort_keys, 0, str(spill_dir), header=header)
+    return count_sorted_run_differences(run_paths1, run_paths2)
+
+
+def test_external_differences_match_the_fingerprint_counts(tmp_path):
+    header = ["id", "value"]
+    rows1 = [
+        {"id": "1", "value": 2**53},
+        {"id": "2", "value": datetime.datetime(2024, 1, 1)},
+        {"id": "3", "value": "same"},
+        {"id": "3", "value": "same"},
+    ]
+    rows2 = [
+        {"id": "1", "value": 2**53 + 1},
+        {"id": "2", "value": "2024-01-01 00:00:00"},
+        {"id": "3", "value": "same"},
+    ]
+    expected = count_fingerprint_differences(
+        row_fingerprints(rows1, header), row_fingerprints(rows2, header)
+    )
+
+    assert expected == (2, 2)
+    assert external_differences(rows1, rows2, header, tmp_path) == expected
+    assert external_differences(rows1, rows2, header, tmp_path, ["id"]) == expected
+
+
+def test_external_sort_follows_the_header_order(tmp_path):
+    header = ["b", "a"]
+    rows = [{"b": "2", "a": "1"}, {"b": "1", "a": "2"}, {"b": "3", "a": "0"}]
+
+    run_paths, num_rows = external_sort_rows(rows, None, 0, str(tmp_path), header=header)
+
+    assert num_rows == 3
+    assert [row for _, row in merge_sorted_runs(run_paths)] == [
+        row for _, row in parallel_sort_rows(rows)
+    ]
+
+
+def test_sample_sort_matches_the_serial_sort():
+    rng = random.Random(7)
+    rows = [
+        {
+            "id": rng.choice(["7", "10", "x", None, 3.5]),
+            "amount": str(rng.randint(-50, 50)),
+            "row": i,
+        }
+        for i in range(3000)
+    ]
+    key_types = {"amount": "int"}
+    expected = sorted(keyed_rows(rows, ["id", "amount"], key_types), key=itemgetter(0))
+
+    keyed_sorted = sample_sort_rows(rows, ["id", "amount"], workers=3, key_types=key_types, min_rows=0)
+
+    # Same keys and the same rows in the same order, ties included
+    assert [key for key, _ in keyed_sorted] == [key for key, _ in expected]
+    assert [row["row"] for _, row in keyed_sorted] == [row["row"] for _, row in expected]
+    assert sample_sort_rows(iter(rows), ["id", "amount"], workers=3, key_types=key_types) == expected
+
+
+def test_partition_rows_keeps_every_row_under_a_tiny_budget(tmp_path):
+    rows = [{"id": str(i % 50), "value": str(i)} for i in range(1000)]
+
+    bucket_paths, num_rows = partition_rows(
+        rows, ["id"], 8, str(tmp_path), "file1", memory_budget_mb=0
+    )
+
+    stored = [entry for path in bucket_paths for entry in read_sorted_run(path)]
+    assert num_rows == 1000
+    assert sorted(row_num for _, row_num, _ in stored) == list(range(1, 1001))
+    # All rows of one key land in the same bucket
+    buckets_per_key = {}
+    for bucket, path in enumerate(bucket_paths):
+        for _, _, row in read_sorted_run(path):
+            buckets_per_key.setdefault(row["id"], set()).add(bucket)
+    assert all(len(buckets) == 1 for buckets in buckets_per_key.values())
+
+
+def test_inserted_row_does_not_shift_the_key_join():
+    rows1 = [{"id": id_, "value": "v" + id_} for id_ in ("a", "b", "c", "d")]
+    rows2 = [{"id": id_, "value": "v" + id_} for id_ in ("a", "b", "bb", "c", "d")]
+
+    pairs = list(
+        merge_join_rows(
+            sorted(keyed_rows(rows1, ["id"]), key=itemgetter(0)),
+            sorted(keyed_rows(rows2, ["id"]), key=itemgetter(0)),
+        )
+    )
+
+    assert [row_nums for row_nums, row1, row2 in pairs if row1 is None or row2 is None] == [(None, 3)]
+    assert all(row1 == row2 for _, row1, row2 in pairs if row1 is not None and row2 is not None)
+    assert len(pairs) == 5
+
+
+def test_identical_rows_under_a_duplicate_key_cancel_first():
+    group1 = [(1, {"id": "k", "value": "x"}), (2, {"id": "k", "value": "y"})]
+    group2 = [(1, {"id": "k", "value": "y"}), (2, {"id": "k", "value": "z"})]
+
+    assert list(pair_key_group(group1, group2)) == [
+        ((1, 2), {"id": "k", "value": "x"}, {"id": "k", "value": "z"})
+    ]
+
+
+def test_merge_join_indices_matches_the_row_join():
+    keys1, fingerprints1 = ["a", "b", "c", "d"], ["a", "b", "c", "d"]
+    keys2, fingerprints2 = ["a", "b", "bb", "c", "d"], ["a", "b", "bb", "c", "d"]
+    assert list(merge_join_indices(keys1, keys2, fingerprints1, fingerprints2)) == [
+        (0, 0), (1, 1), (None, 2), (2, 3), (3, 4)
+    ]
+
+    # The identical "y" rows cancel, leaving "x" to pair with "z"
+    assert list(merge_join_indices(["k", "k"], ["k", "k"], ["x", "y"], ["y", "z"])) == [(0, 1)]
+
+
+def test_hash_engine_rejects_positional_matching(tmp_path):
+    with pytest.raises(ValueError):
+        compare_csv_files(
+            "a.csv", "b.csv", str(tmp_path / "out.html"), engine="hash", match="position"
+        )
+
+
+def test_missing_pyarrow_fails_before_parsing(tmp_path, monkeypatch):
+    monkeypatch.setattr(final_comparison_performance_based, "pa", None)
+    # The input files do not exist, so reaching the parsers would raise FileNotFoundError
+    with pytest.raises(ImportError):
+        compare_csv_files(
+            str(tmp_path / "a.csv"), str(tmp_path / "b.csv"), str(tmp_path / "out.html"),
+            diff_output=str(tmp_path / "diff.parquet"),
+        )
+
+
+def test_preflight_counts_records_not_lines(tmp_path):
+    file1 = tmp_path / "a.csv"
+    file1.write_text('id,note\n1,"two\nlines"\n\n2,plain\n3,"more\n\nlines"\n')
+    file2 = tmp_path / "b.csv"
+    shutil.copy(file1, file2)
+
+    assert files_equivalent(str(file1), str(file2)) == (
+        "byte-identical", len(pd.read_csv(file1)), ["id", "note"]
+    )
+
+
+def test_preflight_headers_match_the_parsed_column_names(tmp_path):
+    file1 = tmp_path / "a.csv"
+    file2 = tmp_path / "b.csv"
+    file3 = tmp_path / "c.csv"
+    file1.write_text("id,name\n1,x\n2,y\n")
+    file2.write_text("id,name\n2,y\n1,x\n")
+    # pandas reads this header as ["id", ' "name"'], so it is not the same file
+    file3.write_text('id, "name"\n2,y\n1,x\n')
+
+    assert files_equivalent(str(file1), str(file2)) == (
+        "identical apart from row order", 2, ["id", "name"]
+    )
+    assert files_equivalent(str(file1), str(file3)) is None
+
+
+def test_preflight_drops_the_record_digest_on_quoted_records(tmp_path):
+    file1 = tmp_path / "a.csv"
+    file2 = tmp_path / "b.csv"
+    file1.write_text('id,name\n1,"x"\n2,y\n')
+    file2.write_text('id,name\n2,y\n1,"x"\n')
+
+    assert files_equivalent(str(file1), str(file2)) is None
+
+
+def test_preflight_artifact_for_header_only_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "output.csv").write_text("Extra records: 0\n")
+    (tmp_path / "h1.csv").write_text("id,a\n")
+    shutil.copy(tmp_path / "h1.csv", tmp_path / "h2.csv")
+
+    compare_csv_files(
+        "h1.csv", "h2.csv", "h.html", sort_keys=["id"], exclude_keys=["a"], diff_output="h.parquet"
+    )
+
+    table = pq.read_table("h.parquet")
+    assert table.num_rows == 0
+    assert [name for name in table.schema.names if name.startswith("key_")] == ["key_id"]
+    assert not any(name.endswith("_a") or name == "a" for name in table.schema.names)
+
+
+@pytest.mark.parametrize("sort_keys", [None, ["id"]])
+def test_diff_artifact_schema_does_not_depend_on_the_ingest_mode(tmp_path, monkeypatch, sort_keys):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "output.csv").write_text("Extra records: 0\n")
+    (tmp_path / "a.csv").write_text("id,name,amount\n1,x,10\n2,y,20\n3,z,30\n")
+    (tmp_path / "b.csv").write_text("id,name,amount\n1,x,10\n2,y,25\n4,w,40\n")
+
+    schemas = {}
+    for ingest in ("rows", "columnar"):
+        compare_csv_files(
+            "a.csv",
+            "b.csv",
+            f"{ingest}.html",
+            sort_keys=sort_keys,
+            ingest=ingest,
+            preflight=False,
+            diff_output=f"{ingest}.parquet",
+        )
+        schemas[ingest] = pq.read_schema(f"{ingest}.parquet")
+
+    assert schemas["rows"].equals(schemas["columnar"], check_metadata=True)
+    assert [name for name in schemas["rows"].names if name.startswith("key_")] == [
+        f"key_{col}" for col in sort_keys or []
+    ]
@@ -0,0 +1,112 @@
+import sys
+import types
+
+import pytest
+
+# masking_functions reads its name lists from a local config.py that is not
+# kept in the repo; give it a small one
+config = types.ModuleType("config")
+config.first_names = ["Ann", "Bob", "Cleo", "Dev"]
+config.last_names = ["Smith", "Jones", "Ng"]
+config.org_names = ["Acme", "Globex"]
+config.org_structure = ["Ltd", "Inc"]
+sys.modules.setdefault("config", config)
+
+from mask import DataMasker, data_byte_range  # noqa: E402
+from masking_functions import Tokenizer, token_acct  # noqa: E402
+
+COLUMNS_TO_MASK = {
+    "ACCT": ("VARCHAR", 6, None),
+    "ID2": ("VARCHAR", None, None),
+    "AMOUNT": ("DECIMAL", (8, 2), None),
+    "DOB": ("DATE", None, None),
+    "QTY": ("INTEGER", 3, None),
+}
+
+
+def write_input(path, num_rows=200):
+    lines = ["ACCT|ID2|AMOUNT|DOB|QTY|NOTE\n"]
+    for i in range(num_rows):
+        lines.append(f"A{i:05d}|{i}|{i}.50|2000-01-01|{i % 9}|row {i}\n")
+    path.write_text("".join(lines))
+
+
+def mask(tmp_path, input_file, name, num_records, workers, seed):
+    output_file = tmp_path / name
+    DataMasker().mask_csv(
+        str(input_file),
+        str(output_file),
+        COLUMNS_TO_MASK,
+        num_records,
+        chunk_size=50,
+        workers=workers,
+        seed=seed,
+    )
+    return output_file.read_text()
+
+
+@pytest.mark.parametrize("num_records", [-1, 120, 333])
+def test_masking_is_the_same_for_any_number_of_workers(tmp_path, num_records):
+    input_file = tmp_path / "in.csv"
+    write_input(input_file)
+
+    serial = mask(tmp_path, input_file, "serial.csv", num_records, 1, 123)
+    parallel = mask(tmp_path, input_file, "parallel.csv", num_records, 3, 123)
+
+    assert parallel == serial
+    assert len(serial.splitlines()) == 1 + max(200, num_records)
+    assert mask(tmp_path, input_file, "other.csv", num_records, 1, 124) != serial
+
+
+def test_tokens_depend_only_on_the_key_and_the_value():
+    values = ["AB1234", None, "CD5678", "AB1234", "short"]
+
+    tokens = Tokenizer("key one", cache_size=1).mask_column(token_acct, values, 6, {})
+    again = Tokenizer("key one").mask_column(token_acct, values, 6, {})
+    other_key = Tokenizer("key two").mask_column(token_acct, values, 6, {})
+
+    assert list(tokens) == list(again)
+    assert tokens[0] == tokens[3] != "AB1234"
+    assert tokens[1] is None
+    assert tokens[4] == "short"  # Only values of exactly length characters are replaced
+    assert tokens[0][:2].isupper() and tokens[0][2:].isdigit()
+    assert list(other_key) != list(tokens)
+
+
+def readlines_split(text, ignore_lines):
+    # The (first line, data, last line) split mask_csv made with readlines()
+    lines = text.splitlines(keepends=True)
+    first_line = last_line = None
+    if ignore_lines in ("NF", "NFL"):
+        first_line, lines = lines[0], lines[1:]
+    if ignore_lines in ("NL", "NFL"):
+        last_line, lines = lines[-1], lines[:-1]
+    return first_line, "".join(lines), last_line
+
+
+@pytest.mark.parametrize(
+    "text, ignore_lines",
+    [
+        ("H|X\n1|a\n2|b\nT|2\n", "NL"),
+        ("H|X\n1|a\n2|b\nT|2", "NL"),
+        ("H|X\n1|a\n2|b\nT|2\n", "NF"),
+        ("H|X\n1|a\n2|b\nT|2", "NFL"),
+        ("H|X\nT|0\n", "NFL"),
+        ("H|X\nT|0", "NFL"),
+        ("H|X\n1|a\n", "NO"),
+    ],
+)
+def test_data_byte_range_matches_readlines_slicing(tmp_path, text, ignore_lines):
+    path = tmp_path / "in.dat"
+    path.write_bytes(text.encode())
+
+    with open(path, "rb") as f:
+        first_line, start, end, last_line = data_byte_range(
+            f,
+            skip_first=ignore_lines in ("NF", "NFL"),
+            skip_last=ignore_lines in ("NL", "NFL"),
+            block_size=2,
+        )
+    data = text.encode()[start:end].decode()
+
+    assert (first_line, data, last_line) == readlines_split(text, ignore_lines)
@@ -0,0 +1,44 @@
+import pandas as pd
+
+from parallel_csv import read_file_parallel, read_rows_parallel
+
+
+def write_quoted_file(path, num_rows=200):
+    lines = ['id,note,amount\n']
+    for i in range(num_rows):
+        if i % 7 == 0:
+            # A quoted field spanning lines, with a delimiter and an escaped quote in it
+            lines.append(f'{i},"line one, ""quoted""\nline two",{i * 1.5}\n')
+        elif i % 11 == 0:
+            lines.append(f'{i},,{i}\n')
+        else:
+            lines.append(f'{i},plain {i},{i}\n')
+    path.write_text("".join(lines))
+
+
+def test_parallel_parse_matches_pandas_on_quoted_multiline_fields(tmp_path):
+    path = tmp_path / "quoted.csv"
+    write_quoted_file(path)
+    expected = pd.read_csv(path, dtype=str)
+
+    # A tiny range_size forces many splits, some of them inside quoted fields
+    batches = list(read_file_parallel(str(path), ",", workers=2, range_size=64))
+    assert len(batches) > 1
+    header = batches[0][0]
+    parsed = pd.concat(
+        [pd.DataFrame(dict(zip(header, columns))) for _, columns in batches], ignore_index=True
+    )
+
+    assert header == list(expected.columns)
+    pd.testing.assert_frame_equal(parsed, expected)
+
+
+def test_parallel_rows_match_the_in_process_reader(tmp_path):
+    path = tmp_path / "quoted.csv"
+    write_quoted_file(path)
+
+    header, rows = read_rows_parallel(str(path), ",", workers=2)
+    expected_header, expected_rows = read_rows_parallel(str(path), ",")
+
+    assert header == expected_header
+    assert rows == expected_rows
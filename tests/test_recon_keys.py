@@ -0,0 +1,32 @@
+import pandas as pd
+
+from recon_keys import composite_key_hashes, key_match_flags, split_on_flags
+
+
+def test_rows_split_on_their_composite_key():
+    rows1 = [
+        {"id": "1", "branch": "a", "value": "x"},
+        {"id": "1", "branch": "b", "value": "y"},
+        {"id": "2", "branch": "a", "value": "z"},
+        {"id": "2", "branch": "a", "value": "z"},
+    ]
+    rows2 = [{"id": "2", "branch": "a", "value": "other"}, {"id": "3", "branch": "a", "value": "w"}]
+
+    matched1, matched2 = key_match_flags(rows1, rows2, ["id", "branch"])
+    kept1, extra1 = split_on_flags(rows1, matched1)
+    kept2, extra2 = split_on_flags(rows2, matched2)
+
+    assert kept1 == rows1[2:]  # Duplicates are kept
+    assert extra1 == rows1[:2]
+    assert kept2 == rows2[:1]
+    assert extra2 == rows2[1:]
+
+
+def test_int_and_float_key_columns_still_match():
+    df1 = pd.DataFrame({"id": [1, 2, 3], "branch": ["a", "a", "b"]})
+    df2 = pd.DataFrame({"id": [1.0, 3.0, 4.5], "branch": ["a", "b", "b"]})
+
+    key_hashes1, key_hashes2 = composite_key_hashes(df1, df2, ["id", "branch"])
+
+    assert key_hashes1.isin(key_hashes2).tolist() == [True, False, True]
+    assert key_hashes2.isin(key_hashes1).tolist() == [True, True, False]
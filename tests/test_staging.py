@@ -0,0 +1,44 @@
+import csv
+import os
+
+import pytest
+
+from staging import stage_temp_files, update_column_names
+
+
+def test_stage_temp_files_copies_or_skips(tmp_path):
+    file1 = tmp_path / "a.csv"
+    file2 = tmp_path / "b.csv"
+    file1.write_bytes(b"id,name\r\n1,x\r\n")
+    file2.write_bytes(b"id,name\n2,y\n")
+    temp_names = (str(tmp_path / "a_tmp.csv"), str(tmp_path / "b_tmp.csv"))
+    size = os.path.getsize(file1) + os.path.getsize(file2)
+
+    staged, copied, avoided = stage_temp_files(str(file1), str(file2), temp_names=temp_names)
+    assert staged == temp_names
+    assert copied + avoided == size
+    assert [open(path, "rb").read() for path in staged] == [file1.read_bytes(), file2.read_bytes()]
+
+    assert stage_temp_files(str(file1), str(file2), mutable=False) == ((str(file1), str(file2)), 0, size)
+
+
+@pytest.mark.parametrize(
+    "new_name, same_length",
+    [("c,d", True), ("renamed, longer", False)],
+)
+def test_update_column_names_keeps_the_body(tmp_path, new_name, same_length):
+    header = b'id,"a,b"\r\n'
+    body = b'1,"x\r\ny"\r\n2,plain\r\n'
+    file = tmp_path / "a_tmp.csv"
+    file.write_bytes(header + body)
+
+    update_column_names(str(file), {"a,b": new_name})
+
+    content = file.read_bytes()
+    assert (len(content) == len(header + body)) == same_length
+    assert content.endswith(body)
+    assert content[: -len(body)].endswith(b"\r\n")
+    with open(file, newline="") as f:
+        reader = csv.DictReader(f)
+        assert reader.fieldnames == ["id", new_name]
+        assert [row[new_name] for row in reader] == ["x\r\ny", "plain"]